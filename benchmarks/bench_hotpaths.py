@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Microbenchmarks of the CoFuzz hot paths on generated fixtures, compare against a JSON baseline"""
+import atexit
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from importlib.util import find_spec
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath('src')))
+
+from fuzz.afl import AFLMap  # noqa: E402
+from fuzz.config import MAP_SIZE  # noqa: E402
+from fuzz.depot import StateDepot  # noqa: E402
+from fuzz.sampler import box_bounds, chebyshev_center, hit_and_run_chains, sample_box  # noqa: E402
+from fuzz.sync import CrackLogParser, Synchronizer  # noqa: E402
+from fuzz.trace import TRACE_COND_DEF, TRACE_DTYPE, CorpusTracer, dump_binary_trace, dump_trace  # noqa: E402
+
+# the backends are imported on first use, probe them so a benchmark is skipped instead of failing midway
+HAS_Z3 = find_spec('z3') is not None
+HAS_SCIPY = find_spec('scipy') is not None
+HAS_SKLEARN = find_spec('sklearn') is not None
+
+BENCHMARKS = dict()
+COND_POOL = ['Br_true_icmp_i32_pred@32', 'Br_false_icmp_i8_pred@33', 'Br_true_call@strcmp_i32_pred@40',
+             'Switch_i32_6', 'Br_false_phi_i64_pred@36', 'Br_true_memcmp_i32_pred@32']
+
+
+def benchmark(name):
+    """Register a benchmark, the function returns (setup, run, items), only run(setup()) is measured"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+# ---------------------------------------------------------------- fixtures
+
+def random_bitmaps(rng, rows, density, diverge=0):
+    """Classified AFL trace bits, the mutants of a seed share the path and diverge on a few edges"""
+    bitmaps = np.zeros((rows, MAP_SIZE), dtype=np.uint8)
+    base = np.flatnonzero(rng.random(MAP_SIZE) < density)
+    bitmaps[:, base] = 1 << rng.integers(0, 8, len(base)).astype(np.uint8)
+    for row in bitmaps:
+        extra = rng.integers(0, MAP_SIZE, diverge)
+        row[extra] = 1 << rng.integers(0, 8, diverge).astype(np.uint8)
+    return bitmaps
+
+
+def trace_edges(rng, lines, blocks):
+    """Branch sequence of a long execution, loops revisit the same edges"""
+    src = rng.integers(1, blocks, lines, dtype=np.uint32)
+    dest = (src * 2 + rng.integers(0, 2, lines, dtype=np.uint32)) % blocks
+    cond = src % len(COND_POOL)
+    return src, dest, cond
+
+
+def text_trace(rng, lines, blocks):
+    src, dest, cond = trace_edges(rng, lines, blocks)
+    trace_lines = [f'[*] ({COND_POOL[c]}): {s},{d}' for s, d, c in zip(src.tolist(), dest.tolist(), cond.tolist())]
+    return '\n'.join(trace_lines).encode()
+
+
+def binary_trace(rng, lines, blocks):
+    """Same layout as trace-rt.o.c, the condition strings are defined before the first use"""
+    src, dest, cond = trace_edges(rng, lines, blocks)
+    stream = io.BytesIO()
+    for cond_id, cond_str in enumerate(COND_POOL):
+        data = cond_str.encode()
+        stream.write(np.array([(TRACE_COND_DEF, len(data), cond_id, 0)], dtype=TRACE_DTYPE).tobytes())
+        stream.write(data.ljust(-(-len(data) // TRACE_DTYPE.itemsize) * TRACE_DTYPE.itemsize, b'\0'))
+    records = np.zeros(lines, dtype=TRACE_DTYPE)
+    records['src'] = src
+    records['dest'] = dest
+    records['cond'] = cond
+    records['depth'] = np.arange(1, lines + 1)
+    stream.write(records.tobytes())
+    return stream.getvalue()
+
+
+def crack_block(src_bb, var_num, seed_len, rng):
+    offsets = rng.choice(seed_len, var_num, replace=False)
+    lines = [f'[STAT] CRACK:{src_bb},{src_bb + 1}']
+    for offset in offsets:
+        lines.append(f'(declare-fun k!{offset}0 () (_ BitVec 8))')
+    for offset in offsets:
+        low = int(rng.integers(0, 128))
+        lines.append(f'(assert (bvuge k!{offset}0 #x{low:02x}))')
+        lines.append(f'(assert (bvule k!{offset}0 #x{low + int(rng.integers(1, 127)):02x}))')
+    lines.append('CRACK-END')
+    return lines
+
+
+def crack_log(rng, blocks, var_num, seed_len):
+    """Canned SymCC stderr, the crack blocks are interleaved with the usual noise"""
+    lines = list()
+    for src_bb in range(blocks):
+        lines.append('[INFO] Trying to solve')
+        lines.extend(crack_block(src_bb, var_num, seed_len, rng))
+    return '\n'.join(lines).encode()
+
+
+def condition_tree(rng, nodes, seeds, shards):
+    """Partial trees of the seeds as returned by dump_trace"""
+    seed_list = [Path(f'/queue/id:{idx:06d},orig:bench') for idx in range(seeds)]
+    shard_list = list()
+    for idx in range(shards):
+        addrs = rng.choice(nodes, nodes // 10, replace=False) + 1
+        shard = dict()
+        for depth, addr in enumerate(addrs.tolist(), start=1):
+            children = set(rng.integers(0, nodes, int(rng.integers(1, 3))).tolist())
+            shard[addr] = [COND_POOL[addr % len(COND_POOL)], children, depth]
+        shard_list.append((seed_list[idx % seeds], shard))
+    return shard_list
+
+
+def build_depot(shard_list, fit_model):
+    depot = StateDepot()
+    tracer = CorpusTracer(depot, None, '@@')
+    for seed_path, shard in shard_list:
+        tracer.merge_shard(seed_path, shard)
+    depot.blk_hit = np.random.default_rng(0).integers(0, 16, MAP_SIZE)
+    if fit_model:
+        depot.concolic_candidate()
+        label_cov = {addr: idx % 3 for idx, addr in enumerate(depot.cov_state)}
+        depot.update_model(label_cov)
+    return depot
+
+
+# ---------------------------------------------------------------- benchmarks
+
+@benchmark('afl.is_interesting')
+def bench_is_interesting(rng, scale):
+    rows = max(1, int(256 * scale))
+    bitmaps = random_bitmaps(rng, rows, 0.01, 16)
+    # the path shared by the mutants is already in the global map
+    virgin = random_bitmaps(rng, 1, 0.1)[0] | np.bitwise_and.reduce(bitmaps, axis=0)
+
+    def setup():
+        afl_map = AFLMap()
+        afl_map.bitmap[:] = virgin
+        return afl_map
+
+    def run(afl_map):
+        for testcase_bitmap in bitmaps:
+            afl_map.is_interesting(testcase_bitmap)
+    return setup, run, rows
+
+
+@benchmark('afl.batch_interesting')
+def bench_batch_interesting(rng, scale):
+    rows = max(1, int(256 * scale))
+    bitmaps = random_bitmaps(rng, rows, 0.01, 16)
+    # the path shared by the mutants is already in the global map
+    virgin = random_bitmaps(rng, 1, 0.1)[0] | np.bitwise_and.reduce(bitmaps, axis=0)
+
+    def setup():
+        afl_map = AFLMap()
+        afl_map.bitmap[:] = virgin
+        return afl_map
+    return setup, lambda afl_map: afl_map.batch_interesting(bitmaps), rows
+
+
+@benchmark('trace.dump_trace')
+def bench_dump_trace(rng, scale):
+    lines = max(1, int(1000000 * scale))
+    trace_info = text_trace(rng, lines, MAP_SIZE // 4)
+    return lambda: None, lambda _: dump_trace(trace_info), lines
+
+
+@benchmark('trace.dump_binary_trace')
+def bench_dump_binary_trace(rng, scale):
+    lines = max(1, int(1000000 * scale))
+    trace_info = binary_trace(rng, lines, MAP_SIZE // 4)
+    return lambda: io.BytesIO(trace_info), dump_binary_trace, lines
+
+
+@benchmark('sync.dump_constraint')
+def bench_dump_constraint(rng, scale):
+    blocks = max(1, int(2000 * scale))
+    constraint_info = crack_log(rng, blocks, 8, 1024)
+    return lambda: None, lambda _: Synchronizer.dump_constraint(constraint_info), blocks
+
+
+@benchmark('sync.crack_log_parser')
+def bench_crack_log_parser(rng, scale):
+    blocks = max(1, int(2000 * scale))
+    lines = crack_log(rng, blocks, 8, 1024).splitlines(keepends=True)
+
+    def run(parser):
+        for line in lines:
+            parser.feed(line)
+    return CrackLogParser, run, blocks
+
+
+@benchmark('sync.crack_target')
+def bench_crack_target(rng, scale):
+    if not (HAS_Z3 and HAS_SCIPY):
+        return None
+    blocks = max(1, int(8 * scale))
+    seed_file = Path(tempfile.mkstemp(prefix='cofuzz-bench-')[1])
+    atexit.register(seed_file.unlink)
+    seed_file.write_bytes(rng.integers(0, 256, 1024, dtype=np.uint8).tobytes())
+    constraints = list(Synchronizer.dump_constraint(crack_log(rng, blocks, 8, 1024)).values())
+
+    def run(sampler):
+        for constraint_list in constraints:
+            sampler.crack_target(seed_file, constraint_list[0])
+    # a fresh memo for each round
+    return lambda: Synchronizer('hit-and-run'), run, blocks
+
+
+@benchmark('depot.merge_shard')
+def bench_merge_shard(rng, scale):
+    shard_list = condition_tree(rng, min(MAP_SIZE - 2, max(10, int(50000 * scale))), 2000, max(1, int(200 * scale)))
+    return lambda: None, lambda _: build_depot(shard_list, False), len(shard_list)
+
+
+@benchmark('depot.concolic_candidate.init')
+def bench_candidate_init(rng, scale):
+    shard_list = condition_tree(rng, min(MAP_SIZE - 2, max(10, int(50000 * scale))), 2000, max(1, int(200 * scale)))
+    return lambda: build_depot(shard_list, False), lambda depot: depot.concolic_candidate(), 1
+
+
+@benchmark('depot.concolic_candidate.predict')
+def bench_candidate_predict(rng, scale):
+    if not HAS_SKLEARN:
+        return None
+    shard_list = condition_tree(rng, min(MAP_SIZE - 2, max(10, int(50000 * scale))), 2000, max(1, int(200 * scale)))
+    return lambda: build_depot(shard_list, True), lambda depot: depot.concolic_candidate(), 1
+
+
+@benchmark('sampler.sample_box')
+def bench_sample_box(rng, scale):
+    dim = 16
+    lower = rng.integers(0, 128, dim).astype(float)
+    leq = np.vstack([np.eye(dim), -np.eye(dim)])
+    leq_rhs = np.concatenate([lower + rng.integers(1, 128, dim), -lower])
+    count = max(1, int(1000 * scale))
+    return lambda: None, lambda _: sample_box(*box_bounds(leq, leq_rhs), count), count
+
+
+@benchmark('sampler.hit_and_run_chains')
+def bench_hit_and_run(rng, scale):
+    if not HAS_SCIPY:
+        return None
+    dim = 16
+    lower = rng.integers(0, 128, dim).astype(float)
+    cuts = rng.normal(size=(dim, dim))
+    leq = np.vstack([np.eye(dim), -np.eye(dim), cuts])
+    leq_rhs = np.concatenate([lower + rng.integers(1, 128, dim), -lower, np.zeros(dim)])
+    center = chebyshev_center(leq[:2 * dim], leq_rhs[:2 * dim])
+    leq_rhs[2 * dim:] = cuts.dot(center) + 10
+    x0 = chebyshev_center(leq, leq_rhs)
+    count = max(1, int(1000 * scale))
+    return lambda: None, lambda _: hit_and_run_chains(leq, leq_rhs, x0, count, 20, 1000, 10), count
+
+
+# ---------------------------------------------------------------- runner
+
+def measure(setup, run, items, repeat):
+    """Median latency of the rounds, the peak memory of an extra traced round"""
+    timings = list()
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        timings.append(time.perf_counter() - start)
+    state = setup()
+    tracemalloc.start()
+    run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    latency = statistics.median(timings)
+    return {
+        'latency_ms': latency * 1000,
+        'per_item_us': latency * 1e6 / items,
+        'throughput': items / latency if latency > 0 else float('inf'),
+        'peak_kb': peak / 1024,
+    }
+
+
+def compare(result, base, tolerance):
+    """Flag the metrics worse than the baseline by more than the tolerance"""
+    flags = list()
+    if result['latency_ms'] > base['latency_ms'] * (1 + tolerance):
+        flags.append(f"latency +{result['latency_ms'] / base['latency_ms'] - 1:.0%}")
+    if result['peak_kb'] > base['peak_kb'] * (1 + tolerance) and result['peak_kb'] - base['peak_kb'] > 64:
+        flags.append(f"memory +{result['peak_kb'] / base['peak_kb'] - 1:.0%}")
+    return flags
+
+
+def parse_args():
+    parser = ArgumentParser(description='Benchmark the CoFuzz hot paths')
+    parser.add_argument('-k', dest='filter', default='', type=str, help='only run the benchmarks containing this')
+    parser.add_argument('-r', dest='repeat', default=5, type=int, help='measured rounds of each benchmark')
+    parser.add_argument('--scale', default=1.0, type=float, help='scale the fixture sizes')
+    parser.add_argument('--seed', default=0, type=int, help='seed of the fixture generator')
+    parser.add_argument('--save', type=Path, help='save the results as the baseline')
+    parser.add_argument('--compare', type=Path, help='flag the regressions against the baseline')
+    parser.add_argument('--tolerance', default=0.2, type=float, help='allowed slowdown against the baseline')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = dict()
+    if args.compare is not None:
+        with open(args.compare, 'r') as fp:
+            baseline = json.load(fp)
+        if baseline['meta']['scale'] != args.scale:
+            print(f"Baseline scale {baseline['meta']['scale']} differs from {args.scale}")
+        baseline = baseline['results']
+    results = dict()
+    regressions = list()
+    print(f"{'benchmark':<34}{'latency':>12}{'per item':>12}{'throughput':>14}{'peak':>12}")
+    for name, bench in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        fixture = bench(np.random.default_rng(args.seed), args.scale)
+        if fixture is None:
+            print(f'{name:<34}{"skipped, dependency missing":>50}')
+            continue
+        result = measure(*fixture, args.repeat)
+        results[name] = result
+        line = f"{name:<34}{result['latency_ms']:>9.2f} ms{result['per_item_us']:>9.2f} us" \
+               f"{result['throughput']:>10.0f} /s{result['peak_kb'] / 1024:>9.1f} MB"
+        if name in baseline:
+            flags = compare(result, baseline[name], args.tolerance)
+            delta = result['latency_ms'] / baseline[name]['latency_ms'] - 1
+            line += f'  {delta:+.0%}'
+            if len(flags) > 0:
+                regressions.append(name)
+                line += f"  REGRESSION ({', '.join(flags)})"
+        print(line)
+    if args.save is not None:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat}
+        with open(args.save, 'w') as fp:
+            json.dump({'meta': meta, 'results': results}, fp, indent=2)
+        print(f'Save the baseline to {args.save}')
+    if len(regressions) > 0:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
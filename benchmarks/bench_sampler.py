@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Compare the sampling kernels in fuzz.sampler with the legacy chains and pwalk"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.joinpath('src')))
+
+from fuzz.sampler import (box_bounds, chebyshev_center, collect_chain, dikin_chains, dikin_walk,  # noqa: E402
+                          hit_and_run, hit_and_run_chains, sample_box)
+
+try:
+    import pwalk
+except ImportError:
+    pwalk = None
+
+COUNT = 1000
+BURN = 1000
+THIN = 10
+CHAINS = 20
+
+
+def box_polytope(dim, rng):
+    lower = rng.integers(0, 128, dim).astype(float)
+    upper = lower + rng.integers(1, 128, dim)
+    leq = np.vstack([np.eye(dim), -np.eye(dim)])
+    return leq, np.concatenate([upper, -lower])
+
+
+def cut_polytope(dim, rng):
+    """Box with a few random half-spaces, not axis-aligned"""
+    leq, leq_rhs = box_polytope(dim, rng)
+    cuts = rng.normal(size=(dim, dim))
+    center = chebyshev_center(leq, leq_rhs)
+    return np.vstack([leq, cuts]), np.concatenate([leq_rhs, cuts.dot(center) + 10])
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def bench(dim, rng):
+    results = dict()
+    leq, leq_rhs = box_polytope(dim, rng)
+    x0 = chebyshev_center(leq, leq_rhs)
+    results['box: sample_box'] = timeit(lambda: sample_box(*box_bounds(leq, leq_rhs), COUNT))
+    results['box: legacy hit-and-run'] = timeit(lambda: collect_chain(hit_and_run, COUNT, BURN, THIN, leq, leq_rhs,
+                                                                      x0.copy()))
+    if pwalk is not None:
+        results['box: pwalk john'] = timeit(lambda: pwalk.generateJohnWalkSamples(x0, leq, leq_rhs, 0.5, COUNT))
+    leq, leq_rhs = cut_polytope(dim, rng)
+    x0 = chebyshev_center(leq, leq_rhs)
+    results['cut: hit-and-run chains'] = timeit(lambda: hit_and_run_chains(leq, leq_rhs, x0, COUNT, CHAINS, BURN,
+                                                                          THIN))
+    results['cut: legacy hit-and-run'] = timeit(lambda: collect_chain(hit_and_run, COUNT, BURN, THIN, leq, leq_rhs,
+                                                                      x0.copy()))
+    results['cut: dikin chains'] = timeit(lambda: dikin_chains(leq, leq_rhs, x0, COUNT, CHAINS, BURN, THIN))
+    results['cut: legacy dikin'] = timeit(lambda: collect_chain(dikin_walk, COUNT, BURN, THIN, leq, leq_rhs, x0, 1))
+    if pwalk is not None:
+        results['cut: pwalk dikin'] = timeit(lambda: pwalk.generateDikinWalkSamples(x0, leq, leq_rhs, 0.5, COUNT))
+        results['cut: pwalk john'] = timeit(lambda: pwalk.generateJohnWalkSamples(x0, leq, leq_rhs, 0.5, COUNT))
+    return results
+
+
+def main():
+    rng = np.random.default_rng(0)
+    for dim in [4, 16, 64]:
+        print(f'dim={dim}, {COUNT} samples')
+        for name, cost in bench(dim, rng).items():
+            print(f'  {name:<28}{cost:>10.1f} ms')
+    if pwalk is None:
+        print('pwalk is not installed, skip the pwalk samplers')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
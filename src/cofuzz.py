@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 import configparser
+import shutil
+import socket
 import sys
+import tempfile
+import time
 from argparse import ArgumentParser, Namespace
+from pathlib import Path
 
 import fuzz.config as config
-from fuzz.common import valid_path, init_dir
-from fuzz.executor import HybridExecutor
+from fuzz.common import valid_path, init_dir, ensure_dir
+
+# imported on demand, the startup profile reports them
+HEAVY_MODULES = ('sklearn', 'scipy', 'z3', 'pwalk', 'tqdm')
 
 
 def parse_args() -> Namespace:
@@ -16,12 +23,45 @@ def parse_args() -> Namespace:
     parser.add_argument('-a', dest='afl', required=True, type=str, help='AFL fuzzer name')
     parser.add_argument('-n', dest='name', default=config.DEFAULT_CONCOLIC_NAME, type=str, help='CoFuzz Name')
     parser.add_argument('-l', dest='log', default=config.DEFAULT_LOG_PATH, type=str, help='log file path')
-    parser.add_argument('-s', dest='sampler', default=config.DEFAULT_SAMPLER, type=str, help='sampler algorithm')
+    parser.add_argument('-s', dest='sampler', default=config.DEFAULT_SAMPLER, choices=config.SAMPLERS,
+                        help='sampler algorithm, box draws the integer points of the crack box directly, '
+                             'the others walk the polytope')
+    parser.add_argument('-j', dest='jobs', default=config.DEFAULT_CONCOLIC_JOBS, type=int,
+                        help='number of parallel concolic workers')
+    parser.add_argument('-t', dest='trace_jobs', default=config.DEFAULT_TRACE_JOBS, type=int,
+                        help='number of parallel trace workers')
+    parser.add_argument('-b', dest='binary_trace', action='store_true', help='use the binary trace protocol')
+    parser.add_argument('--resume', dest='resume', action='store_true', help='continue from the latest checkpoint')
+    parser.add_argument('--min-yield', dest='min_yield', default=config.DEFAULT_MIN_YIELD, type=float,
+                        help='stop a concolic execution once its new coverage rate drops below this value')
+    parser.add_argument('--prometheus', dest='prometheus', default=None, type=Path,
+                        help='also export the stats to this file in the Prometheus text format')
+    parser.add_argument('--coordinate', dest='coordinate', action='store_true',
+                        help='split the work with the other CoFuzz instances of the output directory')
+    parser.add_argument('--cycle-budget', dest='cycle_budget', default=config.CYCLE_BUDGET, type=float,
+                        help='seconds of concolic execution per cycle, split among crack, solve and random solve')
+    parser.add_argument('--profile-startup', dest='profile_startup', action='store_true',
+                        help='report the time of each startup phase and exit')
     return parser.parse_args()
 
 
+def profile_startup(executor, phases) -> None:
+    """Print the startup phases, then the cost of the backends deferred to the first use"""
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    clock = time.perf_counter()
+    executor.sampler.load_backends()
+    phases.append(('sampler backends (deferred)', time.perf_counter() - clock))
+    clock = time.perf_counter()
+    from sklearn.linear_model import SGDRegressor  # noqa: F401
+    phases.append(('edge model (deferred)', time.perf_counter() - clock))
+    for name, elapsed in phases:
+        print(f'{name:<30}: {elapsed * 1000:8.1f} ms')
+    print(f"{'heavy modules at startup':<30}: {', '.join(loaded) if len(loaded) > 0 else 'none'}")
+
+
 def main() -> int:
     """The main function"""
+    clock = time.perf_counter()
     args = parse_args()
     # parse the configure file
     cfg = configparser.ConfigParser()
@@ -30,12 +70,37 @@ def main() -> int:
     concolic_bin = valid_path(cfg.get('put', 'cohuzz_bin'))
     argument = cfg.get('put', 'argument')
     fuzz_out = args.output.joinpath(args.afl)
-    concolic_out = init_dir(args.output.joinpath(args.name))
+    if args.coordinate and args.name == config.DEFAULT_CONCOLIC_NAME:
+        # one output dir per machine, AFL syncs from each of them
+        args.name = f'{config.DEFAULT_CONCOLIC_NAME}-{socket.gethostname()}'
+    if args.profile_startup:
+        # profile in a scratch dir, the output of a running campaign is left alone
+        args.resume, args.coordinate, args.prometheus = False, False, None
+        concolic_out = Path(tempfile.mkdtemp(prefix=f'{args.name}-profile-'))
+    elif args.resume:
+        concolic_out = ensure_dir(args.output.joinpath(args.name))
+    else:
+        concolic_out = init_dir(args.output.joinpath(args.name))
     log_path = concolic_out.joinpath(args.log)
-    executor = HybridExecutor(trace_bin, concolic_bin, argument, fuzz_out, concolic_out, log_path, args.sampler)
+    phases = [('arguments', time.perf_counter() - clock)]
+    clock = time.perf_counter()
+    from fuzz.executor import HybridExecutor
+    phases.append(('import', time.perf_counter() - clock))
+    clock = time.perf_counter()
+    executor = HybridExecutor(trace_bin, concolic_bin, argument, fuzz_out, concolic_out, log_path, args.sampler,
+                              args.jobs, args.trace_jobs, args.binary_trace, args.resume, args.min_yield,
+                              args.prometheus, args.coordinate, args.cycle_budget)
+    phases.append(('executor', time.perf_counter() - clock))
+    executor.logger.info(f'Startup in {sum(elapsed for _, elapsed in phases) * 1000:.0f} ms')
+    if args.profile_startup:
+        profile_startup(executor, phases)
+        executor.shutdown()
+        shutil.rmtree(concolic_out, ignore_errors=True)
+        return 0
     try:
         executor.run()
     except KeyboardInterrupt:
+        executor.checkpoint()
         executor.logger.info(f'Generate {executor.interesting_cnt} interesting seeds,'
                              f'{executor.crash_cnt} crash seeds,'
                              f'{executor.hang_cnt} timeout seeds')
@@ -4,8 +4,28 @@ import tempfile
 from pathlib import Path
 from shlex import split
 
+import numpy as np
+
 from fuzz.common import valid_path
 from fuzz.config import MAP_SIZE, SHOWMAP_TIMEOUT
+from fuzz.forkserver import ForkServer, ForkServerError
+
+
+def _count_class_lookup():
+    """AFL hit-count buckets: 1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+"""
+    lookup = np.zeros(256, dtype=np.uint8)
+    for low, high, bucket in [(1, 1, 1), (2, 2, 2), (3, 3, 4), (4, 7, 8), (8, 15, 16), (16, 31, 32),
+                              (32, 127, 64), (128, 255, 128)]:
+        lookup[low: high + 1] = bucket
+    return lookup
+
+
+COUNT_CLASS_LOOKUP = _count_class_lookup()
+
+
+def classify_counts(trace_bits):
+    """Bucket the raw hit counts the same way as afl-showmap -b"""
+    return COUNT_CLASS_LOOKUP[trace_bits]
 
 
 class AFLConfig:
@@ -21,6 +41,8 @@ class AFLConfig:
         self.afl_showmap = self.afl_dir.joinpath('afl-showmap')
         self.target_cmd = self.__parse_target_cmd()
         self.qemu_mode = '-Q' in self.afl_cmd
+        self.forkserver = None
+        self.input_slot = None
 
     def __parse_fuzz_stats(self):
         fuzz_stats = self.output.joinpath('fuzzer_stats')
@@ -40,7 +62,44 @@ class AFLConfig:
         # invalid program command
         raise Exception(f'Invalid target command: {self.afl_cmd}')
 
+    def start_forkserver(self, input_path):
+        """Validate testcases with a persistent forkserver, fall back to afl-showmap on failure"""
+        self.input_slot = input_path
+        if self.qemu_mode:
+            return False
+        forkserver = None
+        try:
+            forkserver = ForkServer(self.target_cmd, input_path)
+            forkserver.start()
+        except (ForkServerError, OSError):
+            if forkserver is not None:
+                forkserver.close()
+            return False
+        self.forkserver = forkserver
+        return True
+
+    def stop_forkserver(self):
+        if self.forkserver is not None:
+            self.forkserver.close()
+            self.forkserver = None
+
+    def __exec_forkserver(self, testcase, retry=True):
+        try:
+            trace_bits, ret_code = self.forkserver.run(testcase)
+            return classify_counts(trace_bits), ret_code
+        except (ForkServerError, OSError):
+            # restart the forkserver and retry once
+            input_path = self.forkserver.input_path
+            self.stop_forkserver()
+            if retry and self.start_forkserver(input_path):
+                return self.__exec_forkserver(testcase, retry=False)
+            return None
+
     def exec_showmap(self, testcase):
+        if self.forkserver is not None:
+            result = self.__exec_forkserver(testcase)
+            if result is not None:
+                return result
         qemu_cmd = '-Q' if self.qemu_mode else str()
         showmap_target = self.target_cmd.replace('@@', str(testcase))
         with tempfile.NamedTemporaryFile() as output_tmp:
@@ -54,38 +113,75 @@ class AFLConfig:
             ret_code = showmap_proc.poll()
         return testcase_bitmap, ret_code
 
+    def exec_data(self, data):
+        """Validate an in-memory testcase, the showmap fallback reuses a single input file"""
+        if self.forkserver is not None:
+            result = self.__exec_forkserver(data)
+            if result is not None:
+                return result
+        with open(self.input_slot, 'wb') as fp:
+            fp.write(data)
+        return self.exec_showmap(self.input_slot)
+
 
 class AFLMap(object):
-    def __init__(self, bitmap_file=None):
-        self.bitmap_file = bitmap_file
-        self.bitmap = self.__init_bitmap()
-
-    def __init_bitmap(self, map_size=MAP_SIZE):
-        """Load bitmap from file"""
-        bitmap = [0] * map_size
-        if self.bitmap_file and self.bitmap_file.exists():
-            with open(self.bitmap_file, 'rb') as fp:
-                afl_bitmap = bytearray(fp.read())
-            assert len(afl_bitmap) == map_size
-            # flip all the bits
-            for idx, byte_val in enumerate(afl_bitmap):
-                bitmap[idx] = byte_val ^ 255
-        return bitmap
+    def __init__(self, bitmap_file=None, map_size=MAP_SIZE):
+        """Union of the coverage of the AFL instances"""
+        self.bitmap_files = dict()  # virgin map -> (mtime, size) of the merged version
+        self.bitmap = np.zeros(map_size, dtype=np.uint8)
+        if bitmap_file is not None:
+            self.add_bitmap(bitmap_file)
+            self.update_bitmap()
+
+    def add_bitmap(self, bitmap_file):
+        """Merged by the next update_bitmap"""
+        self.bitmap_files.setdefault(bitmap_file, None)
 
     def update_bitmap(self):
-        if self.bitmap_file and self.bitmap_file.exists():
-            with open(self.bitmap_file, 'rb') as fp:
-                afl_bitmap = bytearray(fp.read())
-            for idx, byte_val in enumerate(afl_bitmap):
-                byte_val = byte_val ^ 255
-                self.bitmap[idx] = self.bitmap[idx] | byte_val
-
-    def is_interesting(self, testcase_bitmap):
-        cov_increase = 0
-        for idx in range(len(self.bitmap)):
-            trace_byte = self.bitmap[idx] | testcase_bitmap[idx]
-            if self.bitmap[idx] == trace_byte:
+        """Merge the virgin maps changed since the last merge, the coverage only grows"""
+        for bitmap_file, merged_sig in list(self.bitmap_files.items()):
+            try:
+                file_stat = bitmap_file.stat()
+            except FileNotFoundError:
+                continue
+            file_sig = (file_stat.st_mtime_ns, file_stat.st_size)
+            if file_sig == merged_sig or file_stat.st_size != len(self.bitmap):
+                # AFL rewrites the map in place, a short file is merged by a later update
+                continue
+            virgin_bits = np.fromfile(bitmap_file, dtype=np.uint8)
+            if len(virgin_bits) != len(self.bitmap):
                 continue
-            self.bitmap[idx] = trace_byte
-            cov_increase += 1
+            self.bitmap |= ~virgin_bits
+            self.bitmap_files[bitmap_file] = file_sig
+
+    @staticmethod
+    def as_trace(testcase_bitmap):
+        return np.frombuffer(testcase_bitmap, dtype=np.uint8)
+
+    def is_interesting(self, testcase_bitmap, classified=True):
+        """Count the bytes with new hit-count buckets and merge them"""
+        trace_bits = self.as_trace(testcase_bitmap)
+        if not classified:
+            trace_bits = classify_counts(trace_bits)
+        new_bits = trace_bits & ~self.bitmap
+        cov_increase = int(np.count_nonzero(new_bits))
+        if cov_increase != 0:
+            self.bitmap |= new_bits
+        return cov_increase
+
+    def batch_interesting(self, trace_matrix, classified=True):
+        """Score a matrix of testcase bitmaps (one per row) as if checked in order"""
+        trace_matrix = np.atleast_2d(np.asarray(trace_matrix, dtype=np.uint8))
+        if not classified:
+            trace_matrix = classify_counts(trace_matrix)
+        # the union of the rows locates the novel columns, only those are compared row by row
+        new_idx = np.flatnonzero(np.bitwise_or.reduce(trace_matrix, axis=0) & ~self.bitmap)
+        if len(new_idx) == 0:
+            return np.zeros(len(trace_matrix), dtype=int)
+        new_bits = trace_matrix[:, new_idx] & ~self.bitmap[new_idx]
+        # bits already claimed by the earlier rows
+        seen_bits = np.bitwise_or.accumulate(new_bits, axis=0)
+        seen_bits = np.vstack([np.zeros((1, len(new_idx)), dtype=np.uint8), seen_bits[:-1]])
+        cov_increase = np.count_nonzero(new_bits & ~seen_bits, axis=1)
+        self.bitmap[new_idx] |= seen_bits[-1] | new_bits[-1]
         return cov_increase
@@ -0,0 +1,80 @@
+import hashlib
+from collections import OrderedDict
+
+from fuzz.config import EXEC_CACHE_SIZE
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self.items)
+
+
+class ExecCache:
+    def __init__(self, max_size=EXEC_CACHE_SIZE):
+        """Content-addressed cache of the executed testcases and the coverage already merged"""
+        self.inputs = LRUCache(max_size)  # input hash -> (exit status, coverage digest)
+        self.coverage = LRUCache(max_size)  # digests of the bitmaps merged into the AFL map
+        self.input_hits = 0
+        self.input_miss = 0
+        self.cov_hits = 0
+        self.cov_miss = 0
+
+    def lookup(self, key):
+        result = self.inputs.get(key)
+        if result is None:
+            self.input_miss += 1
+        else:
+            self.input_hits += 1
+        return result
+
+    def insert(self, key, ret, cov_digest=None):
+        self.inputs.put(key, (ret, cov_digest))
+
+    def known_coverage(self, testcase_bitmap):
+        """Digest the bitmap, report whether the same coverage was already merged"""
+        cov_digest = content_hash(testcase_bitmap)
+        if cov_digest in self.coverage:
+            self.cov_hits += 1
+            return cov_digest, True
+        self.cov_miss += 1
+        self.coverage.put(cov_digest, True)
+        return cov_digest, False
+
+    @staticmethod
+    def __rate(hits, miss):
+        return hits / (hits + miss) if hits + miss > 0 else 0.0
+
+    @property
+    def input_hit_rate(self):
+        return self.__rate(self.input_hits, self.input_miss)
+
+    @property
+    def cov_hit_rate(self):
+        return self.__rate(self.cov_hits, self.cov_miss)
+
+    def stats(self):
+        return f'{self.input_hits} duplicate inputs ({self.input_hit_rate:.1%}), ' \
+               f'{self.cov_hits} duplicate bitmaps ({self.cov_hit_rate:.1%})'
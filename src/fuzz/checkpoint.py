@@ -0,0 +1,41 @@
+import os
+import pickle
+import struct
+import zlib
+
+CHECKPOINT_MAGIC = b'CFZCKPT'
+CHECKPOINT_VERSION = 3
+CHECKPOINT_HEADER = struct.Struct('<7sHI')
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def save_checkpoint(path, payload):
+    """Atomically write the payload: header (magic, version, crc32) + zlib compressed pickle"""
+    body = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+    header = CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, zlib.crc32(body))
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    with open(tmp_path, 'wb') as fp:
+        fp.write(header)
+        fp.write(body)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if len(data) < CHECKPOINT_HEADER.size:
+        raise CheckpointError(f'Truncated checkpoint: {path}')
+    magic, version, checksum = CHECKPOINT_HEADER.unpack_from(data)
+    if magic != CHECKPOINT_MAGIC:
+        raise CheckpointError(f'Invalid checkpoint: {path}')
+    if version != CHECKPOINT_VERSION:
+        raise CheckpointError(f'Unsupported checkpoint version {version}: {path}')
+    body = data[CHECKPOINT_HEADER.size:]
+    if zlib.crc32(body) != checksum:
+        raise CheckpointError(f'Corrupted checkpoint: {path}')
+    return pickle.loads(zlib.decompress(body))
@@ -5,12 +5,12 @@ from argparse import ArgumentTypeError
 from pathlib import Path
 
 
-def init_logger(file_name, log_name, verbose=1):
+def init_logger(file_name, log_name, verbose=1, file_mode='w'):
     level_dict = {0: logging.DEBUG, 1: logging.INFO, 2: logging.WARNING}
     formatter = logging.Formatter("[%(asctime)s][%(filename)s][%(levelname)s] %(message)s")
     logger = logging.getLogger(log_name)
     logger.setLevel(level_dict[verbose])
-    fh = logging.FileHandler(file_name, 'w')
+    fh = logging.FileHandler(file_name, file_mode)
     fh.setFormatter(formatter)
     logger.addHandler(fh)
     sh = logging.StreamHandler()
@@ -36,6 +36,11 @@ def init_dir(path: Path) -> Path:
     return path
 
 
+def ensure_dir(path: Path) -> Path:
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
 def identify_id(seed: str) -> str:
     seed_pattern = re.compile(r'^id:(?P<id>\d+),.*$', re.DOTALL)
     matcher = seed_pattern.match(seed)
@@ -45,9 +50,6 @@ def identify_id(seed: str) -> str:
     return seed_id
 
 
-def testcase_core(testcase):
-    new_cover = testcase.name.endswith('+cov')
-    from_seed = 'orig:' in testcase.name
-    file_size = -testcase.stat().st_size
-    base_name = testcase.name
-    return new_cover, from_seed, file_size, base_name
+def seed_key(seed_path: Path) -> str:
+    """Seeds of different fuzzers may share the name, key them by fuzzer/name"""
+    return f'{seed_path.parent.parent.name}/{seed_path.name}'
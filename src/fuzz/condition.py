@@ -1,9 +1,20 @@
 import re
+import sys
+from functools import lru_cache
 
 import numpy as np
 
+# patterns are shared by all the nodes
+BR_PATTERN = re.compile(r'^Br_(?P<value>true|false)_(?P<br_cond>.*)$')
+REG_SWITCH = re.compile(r'^Switch_i(?P<width>\d+)_(?P<case_num>\d+)$')
+REG_PRED = re.compile(r'pred@(?P<type>\d+)')
+REG_WIDTH = re.compile(r'_i(?P<width>\d+)')
+EDGE_ENUM = (('strcmp', 42), ('strncmp', 43), ('memcmp', 44), ('phi', 45), ('call@', 46), ('constInst', 47))
+
 
 class CondBase:
+    __slots__ = ['succ_num', 'edge_type', 'cond_width']
+
     def __init__(self, succ_num):
         self.succ_num = succ_num
         self.edge_type = 0
@@ -15,67 +26,71 @@ class CondBase:
 
 
 class BrCond(CondBase):
+    __slots__ = ['cond_value']
+
     def __init__(self, cond_value: str, br_cond: str, succ_num=2):
         super().__init__(succ_num)
-        self.edge_enum = [('strcmp', 42), ('strncmp', 43), ('memcmp', 44), ('phi', 45), ('call@', 46),
-                          ('constInst', 47)]
         self.edge_type = self.__parse_edge_type(br_cond)
         self.cond_width = self.__parse_cond_width(br_cond)
         self.cond_value = cond_value
 
-    def __parse_edge_type(self, condition):
+    @staticmethod
+    def __parse_edge_type(condition):
         """Parse branch types and set the basic score"""
-        pattern = re.compile(r'pred@(?P<type>\d+)')
-        matcher = pattern.search(condition)
+        matcher = REG_PRED.search(condition)
         if matcher is not None:
             return int(matcher.groupdict()['type'])
-        for str_cmp, cond_type in self.edge_enum:
+        for str_cmp, cond_type in EDGE_ENUM:
             if condition.find(str_cmp) != -1:
                 return cond_type
         return 0
 
     @staticmethod
     def __parse_cond_width(condition):
-        pattern = re.compile(r'_i(?P<width>\d+)')
-        matcher = pattern.search(condition)
+        matcher = REG_WIDTH.search(condition)
         if matcher is not None:
             return np.log2(int(matcher.groupdict()['width']))
         return 0
 
 
 class SwitchCond(CondBase):
+    __slots__ = []
+
     def __init__(self, case_num: int, cond_width: int):
         super().__init__(case_num)
         self.edge_type = 48
         self.cond_width = np.log2(cond_width)
 
 
+@lru_cache(maxsize=None)
+def parse_condition(cond_str: str):
+    """Parse the condition string, the result is shared by the nodes with the same condition"""
+    br_matcher = BR_PATTERN.match(cond_str)
+    if br_matcher is not None:
+        # branch condition
+        cond_value = br_matcher.groupdict()['value']
+        br_cond = br_matcher.groupdict()['br_cond']
+        return BrCond(cond_value, br_cond)
+    switch_matcher = REG_SWITCH.match(cond_str)
+    if switch_matcher is not None:
+        # switch condition
+        case_num = int(switch_matcher.groupdict()['case_num'])
+        cond_width = int(switch_matcher.groupdict()['width'])
+        return SwitchCond(case_num, cond_width)
+    return CondBase(0)
+
+
 class CondStmt:
+    __slots__ = ['addr', 'min_dist', 'cond_str', 'condition', 'children', 'belongs']
+
     def __init__(self, addr: int, cond_str: str, edge_dist: int):
         """Node of the execution tree"""
-        self.br_pattern = re.compile(r'^Br_(?P<value>true|false)_(?P<br_cond>.*)$')
-        self.reg_switch = re.compile(r'^Switch_i(?P<width>\d+)_(?P<case_num>\d+)$')
         self.addr = addr  # basic block id
         self.min_dist = edge_dist  # edge distance to root
-        self.condition = self.__parse_condition(cond_str)
+        self.cond_str = sys.intern(cond_str)
+        self.condition = parse_condition(self.cond_str)
         self.children = set()
-        self.belongs = set()
-
-    def __parse_condition(self, cond_str: str):
-        """Parse the condition string"""
-        br_matcher = self.br_pattern.match(cond_str)
-        if br_matcher is not None:
-            # branch condition
-            cond_value = br_matcher.groupdict()['value']
-            br_cond = br_matcher.groupdict()['br_cond']
-            return BrCond(cond_value, br_cond)
-        switch_matcher = self.reg_switch.match(cond_str)
-        if switch_matcher is not None:
-            # switch condition
-            case_num = int(switch_matcher.groupdict()['case_num'])
-            cond_width = int(switch_matcher.groupdict()['width'])
-            return SwitchCond(case_num, cond_width)
-        return CondBase(0)
+        self.belongs = set()  # ids of the seeds in StateDepot.seed_table
 
     def update_dist(self, edge_dist):
         if edge_dist < self.min_dist:
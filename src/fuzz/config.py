@@ -2,18 +2,38 @@ MAP_SIZE = 65536
 
 CONCOLIC_TIMEOUT = 90
 
+SOLVE_POLL_INTERVAL = 0.05
+
+SOLVE_YIELD_WINDOW = 100
+
+DEFAULT_MIN_YIELD = 0.0
+
 SOLVER_TIMEOUT = 3000
 
+CRACK_TIME_BUDGET = 10000
+
+CONSTRAINT_MEMO_SIZE = 2048
+
 SHOWMAP_TIMEOUT = 5000
 
+EXEC_CACHE_SIZE = 1 << 18
+
+FORKSRV_FD = 198
+
 CANDIDATE_NUM = 10
 
+EDGE_FEATURE_NUM = 4
+
 CRACK_SEED_MAX = 10
 
 BIT_VER_WIDTH = 8
 
 DEFAULT_SAMPLER_NUM = 1000
 
+DEFAULT_SAMPLER_CHAINS = 20
+# floats of the scaled constraint rows of one Dikin step (chains * m * d * d), larger polytopes run fewer chains
+DIKIN_BATCH_FLOATS = 1 << 20
+
 CRACK_UPPER_LIMIT = 8
 
 RAND_SOLVE_NUM = 10
@@ -22,8 +42,59 @@ BYTE_ORDER = 'little'
 
 CUR_INPUT = '.cur_input'
 
+AFL_INPUT = '.afl_input'
+
 DEFAULT_LOG_PATH = 'cofuzz.log'
 
 DEFAULT_CONCOLIC_NAME = 'cofuzz'
 
-DEFAULT_SAMPLER = 'john'
+DEFAULT_SAMPLER = 'box'
+
+SAMPLERS = ('box', 'hit-and-run', 'dikin', 'vaidya', 'john')
+
+DEFAULT_CONCOLIC_JOBS = 1
+
+DEFAULT_TRACE_JOBS = 1
+
+TRACE_CHUNK_RECORDS = 65536
+
+QUEUE_WAIT_TIMEOUT = 60
+
+QUEUE_POLL_INTERVAL = 1
+
+PIPELINE_QUEUE_SIZE = 16
+
+# constraint bytes a crack run buffers ahead of the sampler before its stderr reader blocks
+CRACK_BUFFER_BYTES = 64 << 20
+
+STAGE_JOIN_TIMEOUT = 10
+
+CHECKPOINT_INTERVAL = 600
+
+STATS_INTERVAL = 60
+
+STATS_WINDOW = 1024
+
+CHECKPOINT_NAME = 'checkpoint'
+
+SHARED_DIR = '.cofuzz_shared'
+
+CLAIM_TTL = 3600
+
+CYCLE_BUDGET = 300
+
+MIN_CONCOLIC_TIMEOUT = 10
+
+TIMEOUT_QUANTILE = 90
+
+TIMEOUT_SLACK = 2.0
+
+TIMEOUT_WINDOW = 64
+
+TIMEOUT_MIN_RUNS = 5
+
+BANDIT_EXPLORATION = 0.5
+
+BANDIT_MIN_SHARE = 0.1
+
+BANDIT_DECAY = 0.3
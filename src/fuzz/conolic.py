@@ -1,10 +1,90 @@
+import os
+import queue
 import shutil
 import struct
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from shlex import split
 
+import numpy as np
+
 from fuzz.common import init_dir
-from fuzz.config import CUR_INPUT, CONCOLIC_TIMEOUT, MAP_SIZE
+from fuzz.config import CRACK_BUFFER_BYTES, CUR_INPUT, CONCOLIC_TIMEOUT, DEFAULT_MIN_YIELD, MAP_SIZE, \
+    PIPELINE_QUEUE_SIZE, QUEUE_POLL_INTERVAL, SOLVE_POLL_INTERVAL, SOLVE_YIELD_WINDOW
+from fuzz.sync import CrackLogParser
+from fuzz.watcher import Inotify
+
+
+class SolveJob:
+    __slots__ = ['seed', 'min_yield', 'recent', 'new_cov', 'generated', 'killed', 'stopped']
+
+    def __init__(self, seed, min_yield=DEFAULT_MIN_YIELD):
+        """Concolic execution of a seed, tracks the new coverage yield of its testcases"""
+        self.seed = seed
+        self.min_yield = min_yield
+        self.recent = deque(maxlen=SOLVE_YIELD_WINDOW)
+        self.new_cov = 0
+        self.generated = 0
+        self.killed = False
+        self.stopped = False
+
+    def record(self, cov_increase):
+        self.recent.append(cov_increase > 0)
+        self.new_cov += cov_increase > 0
+
+    def exhausted(self):
+        """The yield over the latest window dropped below the threshold"""
+        if self.min_yield <= 0 or len(self.recent) < SOLVE_YIELD_WINDOW:
+            return False
+        return sum(self.recent) / SOLVE_YIELD_WINDOW < self.min_yield
+
+
+class BlockBuffer:
+    def __init__(self, max_bytes=CRACK_BUFFER_BYTES):
+        """Parsed crack blocks between the stderr reader and the consumer, bounded by the constraint bytes"""
+        self.max_bytes = max_bytes
+        self.blocks = deque()
+        self.size = 0
+        self.done = False
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, block):
+        """Wait while full, a block larger than the bound is still taken alone, False once the consumer left"""
+        with self.cond:
+            while self.size > 0 and self.size + len(block[1]) > self.max_bytes and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                return False
+            self.blocks.append(block)
+            self.size += len(block[1])
+            self.cond.notify_all()
+            return True
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __iter__(self):
+        while True:
+            with self.cond:
+                while len(self.blocks) == 0 and not self.done:
+                    self.cond.wait()
+                if len(self.blocks) == 0:
+                    return
+                block = self.blocks.popleft()
+                self.size -= len(block[1])
+                self.cond.notify_all()
+            yield block
 
 
 class ConcolicExecutor:
@@ -30,8 +110,8 @@ class ConcolicExecutor:
             for value in value_list:
                 fp.write(struct.pack('B', value))
 
-    def __gen_concolic_cmd(self, crack_list=None):
-        concolic_cmd = f'timeout -k 5 {CONCOLIC_TIMEOUT} {self.concolic_cmd}'
+    def __gen_concolic_cmd(self, crack_list=None, timeout=CONCOLIC_TIMEOUT):
+        concolic_cmd = f'timeout -k 5 {timeout} {self.concolic_cmd}'
         concolic_env = {'SYMCC_ENABLE_LINEARIZATION': '1', 'SYMCC_AFL_COVERAGE_MAP': str(self.bitmap),
                         'SYMCC_INPUT_FILE': str(self.cur_input)}
         if crack_list is not None and len(crack_list) > 0:
@@ -42,23 +122,222 @@ class ConcolicExecutor:
             concolic_env['SYMCC_OUTPUT_DIR'] = str(self.output_path)
         return concolic_cmd, concolic_env
 
-    def solve(self, concolic_input):
-        """Executing concolic execution for single seed"""
+    @staticmethod
+    def __list_new(output_dir, seen, partial):
+        """Testcases not handed over yet, the newest one may still be written by SymCC"""
+        names = sorted(name for name in os.listdir(output_dir) if name not in seen)
+        return names[:-1] if partial else names
+
+    def solve(self, concolic_input, on_testcase, should_stop=None, timeout=CONCOLIC_TIMEOUT):
+        """Executing concolic execution for single seed, hand over each testcase once SymCC closes it"""
         output_dir = init_dir(self.output_path)
-        concolic_cmd, concolic_env = self.__gen_concolic_cmd()
+        concolic_cmd, concolic_env = self.__gen_concolic_cmd(timeout=timeout)
         shutil.copy2(concolic_input, self.cur_input)
-        p = subprocess.Popen(split(concolic_cmd), env=concolic_env, stdout=subprocess.PIPE, stdin=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        p.communicate()
+        try:
+            watcher = Inotify(output_dir)
+        except (OSError, AttributeError):
+            # fall back to polling the directory
+            watcher = None
+        p = subprocess.Popen(split(concolic_cmd), env=concolic_env, stdout=subprocess.DEVNULL,
+                             stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seen = set()
+        stopped = False
+
+        def hand_over(names):
+            for name in names:
+                if name in seen:
+                    continue
+                seen.add(name)
+                testcase = output_dir.joinpath(name)
+                try:
+                    data = testcase.read_bytes()
+                except FileNotFoundError:
+                    continue
+                testcase.unlink()
+                on_testcase(data)
+
+        try:
+            while p.poll() is None:
+                if should_stop is not None and should_stop():
+                    p.terminate()
+                    stopped = True
+                    break
+                if watcher is None:
+                    time.sleep(SOLVE_POLL_INTERVAL)
+                    names = self.__list_new(output_dir, seen, partial=True)
+                else:
+                    names = watcher.read_events(SOLVE_POLL_INTERVAL)
+                    if names is None:
+                        names = self.__list_new(output_dir, seen, partial=True)
+                hand_over(names)
+            p.wait()
+            hand_over(self.__list_new(output_dir, seen, partial=False))
+        finally:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+            if watcher is not None:
+                watcher.close()
         killed = p.returncode in [124, -9]
-        testcases = [seed for seed in output_dir.iterdir()]
-        return testcases, killed
+        return len(seen), killed, stopped
+
+    def crack(self, concolic_input, crack_list, timeout=CONCOLIC_TIMEOUT):
+        """Crack the target constraint, yield (src_bb, constraint) as soon as SymCC finishes the block
 
-    def crack(self, concolic_input, crack_list):
-        """Crack the target constraint"""
-        concolic_cmd, concolic_env = self.__gen_concolic_cmd(crack_list)
+        A reader thread drains stderr into a BlockBuffer, so a slow consumer does not stall SymCC on a full
+        pipe while its timeout runs. The reader only blocks once CRACK_BUFFER_BYTES of constraints are pending.
+        """
+        concolic_cmd, concolic_env = self.__gen_concolic_cmd(crack_list, timeout)
         shutil.copy2(concolic_input, self.cur_input)
-        p = subprocess.Popen(split(concolic_cmd), env=concolic_env, stdout=subprocess.PIPE, stdin=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        _, constraint_info = p.communicate()
-        return constraint_info
+        p = subprocess.Popen(split(concolic_cmd), env=concolic_env, stdout=subprocess.DEVNULL,
+                             stdin=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        buffer = BlockBuffer()
+
+        def read_log():
+            parser = CrackLogParser()
+            try:
+                # the stream ends once SymCC exits or the timeout kills it, the finished blocks are kept
+                for line in p.stderr:
+                    block = parser.feed(line)
+                    if block is not None and not buffer.put(block):
+                        break
+            finally:
+                p.stderr.close()
+                buffer.finish()
+
+        reader = threading.Thread(target=read_log, name='cofuzz-crack-log', daemon=True)
+        reader.start()
+        try:
+            yield from buffer
+        finally:
+            # the reader leaves at its next block and closes the pipe
+            buffer.close()
+            if p.poll() is None:
+                p.kill()
+            p.wait()
+
+
+class ConcolicPool:
+    def __init__(self, concolic_dir, output_path, concolic_bin, put_args, jobs=1, min_yield=DEFAULT_MIN_YIELD):
+        """Run concolic executions concurrently, each worker owns a scratch directory"""
+        self.jobs = jobs
+        # SymCC keeps the branches it has seen in its bitmap, the workers merge theirs into the shared one
+        self.bitmap = concolic_dir.joinpath('bitmap')
+        self.bitmap_lock = threading.Lock()
+        self.min_yield = min_yield
+        self.output_path = output_path
+        self.workers = queue.Queue()
+        for idx in range(jobs):
+            worker_dir = concolic_dir if jobs == 1 else init_dir(concolic_dir.joinpath(f'worker_{idx}'))
+            worker_out = output_path.joinpath(f'worker_{idx}')
+            self.workers.put(ConcolicExecutor(worker_dir, worker_out, concolic_bin, put_args))
+        self.pool = ThreadPoolExecutor(max_workers=jobs)
+        self.closed = threading.Event()
+        self.runs = deque()  # (kind, wall seconds) of the finished SymCC runs
+
+    def __put(self, items, item):
+        """Block while the consumer falls behind, give up once the pool is closed"""
+        while not self.closed.is_set():
+            try:
+                items.put(item, timeout=QUEUE_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __checkout(self, worker):
+        """Start the worker from the shared bitmap"""
+        if worker.bitmap == self.bitmap:
+            return
+        with self.bitmap_lock:
+            if self.bitmap.exists():
+                shutil.copyfile(self.bitmap, worker.bitmap)
+
+    def __merge(self, worker):
+        """Fold the branches seen by the worker into the shared bitmap, virgin bits are cleared once seen"""
+        if worker.bitmap == self.bitmap or not worker.bitmap.exists():
+            return
+        with self.bitmap_lock:
+            virgin = np.fromfile(worker.bitmap, dtype=np.uint8)
+            if self.bitmap.exists():
+                shared = np.fromfile(self.bitmap, dtype=np.uint8)
+                if len(shared) == len(virgin):
+                    virgin &= shared
+            tmp_path = self.bitmap.with_name(f'.{self.bitmap.name}.tmp')
+            virgin.tofile(tmp_path)
+            os.replace(tmp_path, self.bitmap)
+
+    def __solve_job(self, job, testcases, timeout):
+        if self.closed.is_set():
+            return
+        worker = self.workers.get()
+        self.__checkout(worker)
+        start = time.time()
+        try:
+            job.generated, job.killed, job.stopped = worker.solve(
+                job.seed, lambda data: self.__put(testcases, (job, data)),
+                lambda: job.exhausted() or self.closed.is_set(), timeout)
+            if not job.stopped:
+                # an early stop says nothing about the runtime of the seed
+                self.runs.append(('solve', time.time() - start))
+        finally:
+            self.__merge(worker)
+            self.workers.put(worker)
+            self.__put(testcases, (job, None))
+
+    def __crack_job(self, concolic_input, crack_list, blocks, timeout):
+        if self.closed.is_set():
+            return
+        worker = self.workers.get()
+        self.__checkout(worker)
+        start = time.time()
+        try:
+            for block in worker.crack(concolic_input, crack_list, timeout):
+                if not self.__put(blocks, (concolic_input, crack_list, block)):
+                    break
+            else:
+                self.runs.append(('crack', time.time() - start))
+        finally:
+            self.__merge(worker)
+            self.workers.put(worker)
+            self.__put(blocks, (concolic_input, crack_list, None))
+
+    def __collect(self, items, futures, job_done):
+        """Yield the items of the jobs until all of them end or the pool is closed"""
+        pending = len(futures)
+        while pending > 0 and not self.closed.is_set():
+            try:
+                item = items.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if job_done(item):
+                pending -= 1
+            yield item
+        if not self.closed.is_set():
+            for future in futures:
+                # raise the errors of the workers
+                future.result()
+
+    def solve(self, seed_list, timeout=CONCOLIC_TIMEOUT):
+        """Yield (job, testcase bytes) while SymCC is running, the testcase is None once the seed ends"""
+        testcases = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        jobs = [SolveJob(seed, self.min_yield) for seed in seed_list]
+        futures = [self.pool.submit(self.__solve_job, job, testcases, timeout) for job in jobs]
+        yield from self.__collect(testcases, futures, lambda item: item[1] is None)
+
+    def crack(self, crack_jobs, timeout=CONCOLIC_TIMEOUT):
+        """Yield (seed, crack_list, (src_bb, constraint)) while SymCC runs, the block is None once the seed ends"""
+        blocks = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        futures = [self.pool.submit(self.__crack_job, seed, crack_list, blocks, timeout)
+                   for seed, crack_list in crack_jobs]
+        yield from self.__collect(blocks, futures, lambda item: item[2] is None)
+
+    def pop_runs(self):
+        runs = list()
+        while len(self.runs) > 0:
+            runs.append(self.runs.popleft())
+        return runs
+
+    def shutdown(self):
+        self.closed.set()
+        self.pool.shutdown(wait=False)
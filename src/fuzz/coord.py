@@ -0,0 +1,125 @@
+import os
+import time
+
+from fuzz.cache import content_hash
+from fuzz.common import ensure_dir, seed_key
+from fuzz.config import CLAIM_TTL
+
+
+class Coordinator:
+    def __init__(self, shared_dir, instance):
+        """Split the concolic work among the CoFuzz instances sharing a sync directory"""
+        self.instance = instance
+        self.claim_dir = ensure_dir(shared_dir.joinpath('claims'))
+        self.ledger_dir = ensure_dir(shared_dir.joinpath('ledger'))
+        # append-only, each instance writes its own ledger so no lock is needed across the machines
+        self.ledger = open(self.ledger_dir.joinpath(instance), 'a')
+        self.offsets = dict()
+        self.done = set()  # (kind, claim key) finished or taken by the other instances
+        self.pending = list()  # ledger lines not merged into the depot yet
+        self.conflicts = 0
+
+    def __claim_path(self, kind, key):
+        return self.claim_dir.joinpath(f'{kind}-{content_hash(key.encode()).hex()}')
+
+    def __owner(self, path):
+        try:
+            with open(path, 'r') as fp:
+                return fp.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def __expire(self, path):
+        """Remove a claim of a dead instance, the rename lets only one instance win"""
+        try:
+            if time.time() - path.stat().st_mtime < CLAIM_TTL:
+                return False
+            stale_path = path.with_name(f'.{path.name}.{self.instance}')
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            return False
+        os.unlink(stale_path)
+        return True
+
+    def claim(self, kind, key, retry=True):
+        """Atomically take the work, False if another instance owns it or has logged it"""
+        if (kind, key) in self.done:
+            self.conflicts += 1
+            return False
+        path = self.__claim_path(kind, key)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if self.__owner(path) == self.instance:
+                return True
+            if retry and self.__expire(path):
+                return self.claim(kind, key, retry=False)
+            self.conflicts += 1
+            return False
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(self.instance)
+        # the owner logs the work before dropping its claim, so the ledgers read now list it if it is taken
+        self.__refresh()
+        if (kind, key) in self.done:
+            os.unlink(path)
+            self.conflicts += 1
+            return False
+        return True
+
+    def claim_cracks(self, candidate):
+        """Keep the (seed, edge) pairs claimed by this instance"""
+        claimed = dict()
+        for seed_path, crack_list in candidate.items():
+            # the claim key joins the ledger fields, record() finds the claim to drop from them
+            addrs = [addr for addr in crack_list if self.claim('crack', f'{addr},{seed_key(seed_path)}')]
+            for addr in addrs:
+                self.record('crack', addr, seed_key(seed_path))
+            if len(addrs) > 0:
+                claimed[seed_path] = addrs
+        return claimed
+
+    def record(self, kind, *args):
+        """Log the work taken by this instance, the ledger guards it from then on so the claim is dropped"""
+        self.ledger.write('\t'.join([kind] + [str(arg) for arg in args]) + '\n')
+        self.ledger.flush()
+        try:
+            os.unlink(self.__claim_path(kind, ','.join(str(arg) for arg in args)))
+        except FileNotFoundError:
+            pass
+
+    def __read_ledgers(self):
+        """New complete lines of the other instances"""
+        with os.scandir(self.ledger_dir) as entries:
+            for entry in entries:
+                if entry.name == self.instance or entry.name.startswith('.'):
+                    continue
+                offset = self.offsets.get(entry.name, 0)
+                if entry.stat().st_size <= offset:
+                    continue
+                with open(entry.path, 'rb') as fp:
+                    fp.seek(offset)
+                    data = fp.read()
+                # a line being written by the owner is read in the next round
+                end = data.rfind(b'\n') + 1
+                self.offsets[entry.name] = offset + end
+                for line in data[:end].decode(errors='replace').splitlines():
+                    yield line.split('\t')
+
+    def __refresh(self):
+        for fields in self.__read_ledgers():
+            self.done.add((fields[0], ','.join(fields[1:])))
+            self.pending.append(fields)
+
+    def sync(self, depot, queue_index):
+        """Merge the work done by the other instances into the depot"""
+        self.__refresh()
+        pending, self.pending = self.pending, list()
+        for fields in pending:
+            if fields[0] == 'solve' and len(fields) == 2:
+                depot.solved_seeds.add(fields[1])
+                queue_index.mark_solved(fields[1])
+            elif fields[0] == 'crack' and len(fields) == 3:
+                depot.mark_cracked(int(fields[1]), fields[2])
+
+    def close(self):
+        self.ledger.close()
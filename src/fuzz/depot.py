@@ -1,17 +1,37 @@
 import random
+import threading
 from collections import defaultdict
+from pathlib import Path
 
 import numpy as np
-from sklearn.linear_model import SGDRegressor
 
 import fuzz.config as config
+from fuzz.common import seed_key
+from fuzz.condition import CondStmt
+from fuzz.feature import FeatureMatrix
+from fuzz.frontier import FrontierIndex
+
+
+BYTE_ORDER_CHAR = {'little': '<', 'big': '>'}
+# the bb_bitmap of AFL is an array of 4-byte counters
+BB_HIT_DTYPE = np.dtype(np.uint32).newbyteorder(BYTE_ORDER_CHAR[config.BYTE_ORDER])
 
 
 class StateDepot:
     def __init__(self) -> None:
+        # guards the depot between the tracer and the scheduler
+        self.lock = threading.RLock()
         self.cov_state = dict()
-        self.reg = SGDRegressor(max_iter=1000)
-        self.blk_hit = [0] * config.MAP_SIZE
+        # seeds in the tree are referred by their index in the table
+        self.seed_table = list()
+        self.seed_keys = list()  # seed_key of each seed in the table
+        self.seed_index = dict()
+        self.reg = None  # built by the first model update, sklearn is slow to import
+        self.reg_state = None  # (coef, intercept, t) of a resumed model until the next update
+        self.blk_hit = np.zeros(config.MAP_SIZE, dtype=int)
+        self.blk_files = dict()  # bb_bitmap -> (mtime, size), counters
+        self.edge_matrix = FeatureMatrix()
+        self.frontier = FrontierIndex()
         self.init_phase = True
         # states
         self.traced_seeds = set()
@@ -19,101 +39,192 @@ class StateDepot:
         self.cracked_seed = set()
         self.cracked_addr = defaultdict(int)
 
+    def seed_id(self, seed_path):
+        """Intern the seed path"""
+        seed_id = self.seed_index.get(seed_path)
+        if seed_id is None:
+            seed_id = len(self.seed_table)
+            self.seed_table.append(seed_path)
+            self.seed_keys.append(seed_key(seed_path))
+            self.seed_index[seed_path] = seed_id
+        return seed_id
+
     @staticmethod
-    def __parse_bitmap(bit_arr, step=4):
-        """Parse the bitmap of basic block hits in AFL"""
-        vec_int = list()
-        for idx in range(0, len(bit_arr), step):
-            bit_clip = bit_arr[idx: idx + step]
-            bb_hit = int.from_bytes(bit_clip, config.BYTE_ORDER, signed=False)
-            if bb_hit > 0:
-                bb_hit = int(np.log2(bb_hit))
-            vec_int.append(bb_hit)
+    def __parse_bitmap(bb_hit):
+        """log2 bucket of each basic block counter"""
+        vec_int = np.zeros(len(bb_hit), dtype=int)
+        hit_mask = bb_hit > 0
+        vec_int[hit_mask] = np.log2(bb_hit[hit_mask]).astype(int)
         return vec_int
 
-    def resolve_fuzz_hits(self, bb_bitmap):
-        """Resolve the basic block hits"""
-        with open(bb_bitmap, 'rb') as fp:
-            self.blk_hit = self.__parse_bitmap(fp.read())
-
-    def __init_edges(self):
-        addr_candidate = list()
-        for addr, cond_node in self.cov_state.items():
-            if cond_node.is_branch_covered():
+    def resolve_fuzz_hits(self, bb_bitmaps):
+        """Resolve the basic block hits summed over the fuzzers, reload only the changed files"""
+        changed = False
+        for bb_bitmap in bb_bitmaps:
+            try:
+                file_stat = bb_bitmap.stat()
+            except FileNotFoundError:
                 continue
-            addr_candidate.append(addr)
-        random.shuffle(addr_candidate)
-        return addr_candidate
-
-    def __edge_predict(self):
-        """Predict the edge fitness value"""
-        addr_prior = list()
-        for addr, cond_node in self.cov_state.items():
-            if cond_node.is_branch_covered():
-                continue
-            if self.cracked_addr[addr] >= config.CRACK_UPPER_LIMIT:
+            file_sig = (file_stat.st_mtime_ns, file_stat.st_size)
+            if self.blk_files.get(bb_bitmap, (None, None))[0] == file_sig:
                 continue
-            edge_feature = cond_node.edge_feature()
-            edge_feature = np.append(edge_feature, self.blk_hit[addr])
-            addr_prior.append({
-                'addr': addr,
-                'value': self.reg.predict(edge_feature.reshape(1, len(edge_feature)))
-            })
-        addr_prior.sort(key=lambda x: x['value'], reverse=True)
-        addr_candidate = [item['addr'] for item in addr_prior]
-        return addr_candidate
-
-    def __seed_selection(self, addr, seed_max):
-        """Select the candidate seed for each edge"""
-        cond_node = self.cov_state[addr]
-        solved_list = list()
-        unsolved_list = list()
-        for seed_path in cond_node.belongs:
-            if (addr, seed_path.name) in self.cracked_seed:
-                continue
-            if seed_path.name in self.solved_seeds:
-                solved_list.append(seed_path)
-            else:
-                unsolved_list.append(seed_path)
-        if len(unsolved_list) >= seed_max:
-            seed_list = random.sample(unsolved_list, seed_max)
+            bb_hit = np.fromfile(bb_bitmap, dtype=BB_HIT_DTYPE).astype(np.uint64)
+            self.blk_files[bb_bitmap] = (file_sig, bb_hit)
+            changed = True
+        if changed:
+            self.blk_hit = self.__parse_bitmap(sum(bb_hit for _, bb_hit in self.blk_files.values()))
+
+    def touch(self, addrs, seed_id=None, covered=True):
+        """Mark the nodes as changed by the tracer, keep the frontier in step
+
+        Covered nodes leave the frontier, the uncovered ones get the seed in their reservoir.
+        """
+        self.edge_matrix.touch(addrs)
+        if covered:
+            for addr in addrs:
+                row = self.edge_matrix.rows.get(addr)
+                if row is not None:
+                    self.frontier.cover(row)
+            return
+        if seed_id is None:
+            return
+        key = self.seed_keys[seed_id]
+        solved = key in self.solved_seeds
+        for addr in addrs:
+            # most edges were never cracked, skip the lookup of the pair
+            if addr not in self.cracked_addr or (addr, key) not in self.cracked_seed:
+                self.frontier.add_seed(self.edge_matrix.row(addr), seed_id, solved)
+
+    def __init_edges(self, edge_max):
+        rows = self.frontier.edges()
+        if len(rows) > edge_max:
+            rows = rows[random.sample(range(len(rows)), edge_max)]
+        else:
+            rows = np.random.permutation(rows)
+        return rows
+
+    def __edge_predict(self, edge_max):
+        """Predict the fitness value of the frontier edges, return the top edges"""
+        rows = self.frontier.edges()
+        rows = rows[self.edge_matrix.cracked[rows] < config.CRACK_UPPER_LIMIT]
+        if len(rows) == 0:
+            return rows
+        self.edge_matrix.sync(self.cov_state)
+        coef, intercept, _ = self.__model_state()
+        # the linear model without sklearn, a resumed campaign predicts before the first update
+        value = self.edge_matrix.matrix(rows, self.blk_hit) @ coef + intercept
+        if len(rows) > edge_max:
+            top_idx = np.argpartition(-value, edge_max - 1)[:edge_max]
         else:
-            sample_num = min(seed_max - len(unsolved_list), len(solved_list))
-            seed_list = unsolved_list + random.sample(solved_list, sample_num)
-        return seed_list
+            top_idx = np.arange(len(rows))
+        # stable order among the equal values
+        top_idx = top_idx[np.lexsort((top_idx, -value[top_idx]))]
+        return rows[top_idx]
+
+    def __seed_selection(self, row, addr, seed_max):
+        """Draw the candidate seeds of the edge from its reservoir"""
+        return self.frontier.take(row, seed_max, lambda seed_id: self.seed_keys[seed_id] in self.solved_seeds,
+                                  lambda seed_id: (addr, self.seed_keys[seed_id]) in self.cracked_seed)
 
-    def concolic_candidate(self, edge_max=config.CANDIDATE_NUM, seed_max=config.CRACK_SEED_MAX):
-        """Acquire and sort the missed edges"""
+    def concolic_candidate(self, edge_max=config.CANDIDATE_NUM, seed_max=config.CRACK_SEED_MAX, seed_limit=None):
+        """Acquire and sort the missed edges, at most seed_limit seeds are cracked"""
         if self.init_phase:
-            addr_candidate = self.__init_edges()
+            row_candidate = self.__init_edges(edge_max)
         else:
-            addr_candidate = self.__edge_predict()
-        edge_cnt = 0
+            row_candidate = self.__edge_predict(edge_max)
         candidate = defaultdict(list)
-        for addr in addr_candidate:
-            for seed_path in self.__seed_selection(addr, seed_max):
+        for row in row_candidate.tolist():
+            addr = int(self.edge_matrix.addrs[row])
+            for seed_id in self.__seed_selection(row, addr, seed_max):
+                seed_path = self.seed_table[seed_id]
+                if seed_limit is not None and seed_path not in candidate and len(candidate) >= seed_limit:
+                    # left for the next cycles
+                    self.frontier.add_seed(row, seed_id, self.seed_keys[seed_id] in self.solved_seeds)
+                    continue
                 candidate[seed_path].append(addr)
-                self.cracked_seed.add((addr, seed_path.name))
+                self.cracked_seed.add((addr, self.seed_keys[seed_id]))
                 self.cracked_addr[addr] += 1
-            edge_cnt += 1
-            if edge_cnt >= edge_max:
-                return candidate
+                self.edge_matrix.add_crack(addr)
         return candidate
 
+    def mark_cracked(self, addr, key):
+        """Record a crack made by another instance"""
+        if (addr, key) in self.cracked_seed:
+            return
+        self.cracked_seed.add((addr, key))
+        self.cracked_addr[addr] += 1
+        if addr in self.cov_state:
+            self.edge_matrix.add_crack(addr)
+
     def update_model(self, label_cov):
         if len(label_cov) == 0:
             return
         if self.init_phase:
             self.init_phase = False
-        feature_x = list()
-        label_y = list()
-        for addr, cov in label_cov.items():
-            cond_node = self.cov_state[addr]
-            edge_feature = cond_node.edge_feature()
-            edge_feature = np.append(edge_feature, self.blk_hit[addr])
-            feature_x.append(edge_feature)
-            label_y.append(cov)
-        dx = np.array(feature_x)
-        dy = np.array(label_y)
+        if self.reg is None:
+            from sklearn.linear_model import SGDRegressor
+            self.reg = SGDRegressor(max_iter=1000)
+            if self.reg_state is not None:
+                coef, intercept, self.reg.t_ = self.reg_state
+                self.reg.coef_, self.reg.intercept_ = coef.copy(), intercept.copy()
+                self.reg.n_features_in_ = len(coef)
+                self.reg_state = None
+        self.edge_matrix.sync(self.cov_state)
+        dx = self.edge_matrix.matrix(self.edge_matrix.row_of(list(label_cov.keys())), self.blk_hit)
+        dy = np.array(list(label_cov.values()))
         # update the model
         self.reg.partial_fit(dx, dy)
+
+    def __model_state(self):
+        if self.reg is None:
+            return self.reg_state
+        return self.reg.coef_, self.reg.intercept_, self.reg.t_
+
+    def snapshot(self):
+        """Dump the depot into plain data, seeds in the tree are stored as indices of a path table"""
+        cond_nodes = list()
+        for addr, cond_node in self.cov_state.items():
+            cond_nodes.append((addr, cond_node.cond_str, cond_node.min_dist, list(cond_node.children),
+                               list(cond_node.belongs)))
+        return {
+            'seed_table': [str(seed_path) for seed_path in self.seed_table],
+            'cov_state': cond_nodes,
+            # the weights only, unpickling the estimator would import sklearn at the startup
+            'reg': self.__model_state(),
+            'init_phase': self.init_phase,
+            'traced_seeds': set(self.traced_seeds),
+            'solved_seeds': set(self.solved_seeds),
+            'cracked_seed': set(self.cracked_seed),
+            'cracked_addr': dict(self.cracked_addr),
+        }
+
+    def restore(self, state):
+        self.seed_table = [Path(seed_path) for seed_path in state['seed_table']]
+        self.seed_keys = [seed_key(seed_path) for seed_path in self.seed_table]
+        self.seed_index = {seed_path: seed_id for seed_id, seed_path in enumerate(self.seed_table)}
+        self.cov_state = dict()
+        for addr, cond_str, min_dist, children, belongs in state['cov_state']:
+            cond_node = CondStmt(addr, cond_str, min_dist)
+            cond_node.children.update(children)
+            cond_node.belongs.update(belongs)
+            self.cov_state[addr] = cond_node
+        self.reg = None
+        self.reg_state = state['reg']
+        self.init_phase = state['init_phase']
+        self.traced_seeds = state['traced_seeds']
+        self.solved_seeds = state['solved_seeds']
+        self.cracked_seed = state['cracked_seed']
+        self.cracked_addr = defaultdict(int, state['cracked_addr'])
+        self.edge_matrix = FeatureMatrix()
+        self.frontier = FrontierIndex()
+        for addr, cond_node in self.cov_state.items():
+            if cond_node.is_branch_covered():
+                self.touch([addr])
+                continue
+            self.touch([addr], covered=False)
+            for seed_id in cond_node.belongs:
+                self.touch([addr], seed_id, covered=False)
+        self.edge_matrix.sync(self.cov_state)
+        for addr, count in self.cracked_addr.items():
+            if addr in self.cov_state:
+                self.edge_matrix.add_crack(addr, count)
@@ -1,154 +1,468 @@
 import atexit
+import queue
 import shutil
 import tempfile
+import threading
 import time
 from collections import defaultdict
 from pathlib import Path
 
+import numpy as np
+
 import fuzz.common as utils
 from fuzz.afl import AFLConfig, AFLMap
-from fuzz.common import testcase_core
-from fuzz.config import RAND_SOLVE_NUM
-from fuzz.conolic import ConcolicExecutor
+from fuzz.cache import ExecCache, content_hash
+from fuzz.checkpoint import CheckpointError, load_checkpoint, save_checkpoint
+from fuzz.config import AFL_INPUT, CHECKPOINT_INTERVAL, CHECKPOINT_NAME, CYCLE_BUDGET, DEFAULT_MIN_YIELD, \
+    PIPELINE_QUEUE_SIZE, QUEUE_POLL_INTERVAL, QUEUE_WAIT_TIMEOUT, SHARED_DIR, STAGE_JOIN_TIMEOUT
+from fuzz.conolic import ConcolicPool
+from fuzz.coord import Coordinator
 from fuzz.depot import StateDepot
+from fuzz.scheduler import ModeScheduler
+from fuzz.stats import Telemetry, cpu_time
 from fuzz.sync import Synchronizer
 from fuzz.trace import CorpusTracer
+from fuzz.watcher import CorpusIndex
 
 
 class HybridExecutor:
-    def __init__(self, trace_bin, concolic_bin, argument, fuzz_out, concolic_out, log_path, sampler):
+    def __init__(self, trace_bin, concolic_bin, argument, fuzz_out, concolic_out, log_path, sampler, jobs=1,
+                 trace_jobs=1, binary_trace=False, resume=False, min_yield=DEFAULT_MIN_YIELD, prometheus=None,
+                 coordinate=False, cycle_budget=CYCLE_BUDGET):
         """CoFuzz Executor"""
-        self.logger = utils.init_logger(log_path, log_path.name)
+        self.logger = utils.init_logger(log_path, log_path.name, file_mode='a' if resume else 'w')
         self.afl_config = AFLConfig(fuzz_out)
-        self.afl_map = AFLMap(self.afl_config.fuzz_bitmap)
+        # the corpus and the coverage of all the AFL instances in the sync dir
+        self.queue_index = CorpusIndex(fuzz_out.parent)
+        self.afl_map = AFLMap()
+        self.__watch_fuzzers()
+        self.afl_map.update_bitmap()
         self.depot = StateDepot()
+        self.telemetry = Telemetry(concolic_out, prometheus)
+        self.exec_cache = ExecCache()
+        self.scheduler = ModeScheduler(cycle_budget)
+        # instances sharing the AFL sync dir split the work, each one owns its output dir
+        self.coordinator = None
+        if coordinate:
+            self.coordinator = Coordinator(fuzz_out.parent.joinpath(SHARED_DIR), concolic_out.name)
         self.tmp_dir = Path(tempfile.mkdtemp())
-        self.concolic = ConcolicExecutor(concolic_out, self.tmp_dir.joinpath('concolic'), concolic_bin, argument)
-        self.tracer = CorpusTracer(self.depot, trace_bin, argument)
-        self.sampler = Synchronizer(self.tmp_dir.joinpath('sample'), sampler)
+        self.concolic = ConcolicPool(concolic_out, self.tmp_dir.joinpath('concolic'), concolic_bin, argument, jobs,
+                                     min_yield)
+        self.tracer = CorpusTracer(self.depot, trace_bin, argument, trace_jobs, binary_trace)
+        self.sampler = Synchronizer(sampler, self.telemetry, self.logger)
         atexit.register(self.__clean_temp_dir)
+        if not self.afl_config.start_forkserver(self.tmp_dir.joinpath(AFL_INPUT)):
+            self.logger.info('Forkserver unavailable, validate testcases with afl-showmap')
 
-        self.concolic_queue = utils.init_dir(concolic_out.joinpath('queue'))
-        self.concolic_hangs = utils.init_dir(concolic_out.joinpath('hangs'))
-        self.concolic_crash = utils.init_dir(concolic_out.joinpath('crashes'))
+        prepare_dir = utils.ensure_dir if resume else utils.init_dir
+        self.concolic_queue = prepare_dir(concolic_out.joinpath('queue'))
+        self.concolic_hangs = prepare_dir(concolic_out.joinpath('hangs'))
+        self.concolic_crash = prepare_dir(concolic_out.joinpath('crashes'))
         self.interesting_cnt = 0
         self.crash_cnt = 0
         self.hang_cnt = 0
+        self.cycle_cnt = 0
+        self.checkpoint_path = concolic_out.joinpath(CHECKPOINT_NAME)
+        self.checkpoint_time = time.time()
+        # pipeline stages, bounded queues block the producers when a stage falls behind
+        self.sample_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.validate_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        self.label_cov = defaultdict(int)  # written by the validator only
+        self.stopping = threading.Event()
+        self.new_seeds = threading.Event()
+        self.trace_ready = threading.Event()
+        self.stages = list()
+        if resume:
+            self.__resume()
+
+    def __resume(self):
+        """Continue from the latest snapshot"""
+        if not self.checkpoint_path.exists():
+            self.logger.info('No checkpoint found, start from scratch')
+            return
+        try:
+            payload = load_checkpoint(self.checkpoint_path)
+        except CheckpointError as e:
+            self.logger.info(f'Ignore checkpoint: {e}')
+            return
+        self.depot.restore(payload['depot'])
+        if 'scheduler' in payload:
+            self.scheduler.restore(payload['scheduler'])
+        # the output dirs may be ahead of the snapshot
+        self.interesting_cnt = max(payload['interesting_cnt'], len(list(self.concolic_queue.iterdir())))
+        self.hang_cnt = max(payload['hang_cnt'], len(list(self.concolic_hangs.iterdir())))
+        self.crash_cnt = max(payload['crash_cnt'], len(list(self.concolic_crash.iterdir())))
+        for seed_name in self.depot.solved_seeds:
+            self.queue_index.mark_solved(seed_name)
+        self.logger.info(f'Resume from checkpoint: {len(self.depot.cov_state)} nodes, '
+                         f'{len(self.depot.traced_seeds)} traced seeds, {len(self.depot.solved_seeds)} solved seeds')
+
+    def checkpoint(self):
+        """Snapshot the depot and the output counters"""
+        with self.depot.lock:
+            depot = self.depot.snapshot()
+        payload = {
+            'depot': depot,
+            'scheduler': self.scheduler.snapshot(),
+            'interesting_cnt': self.interesting_cnt,
+            'hang_cnt': self.hang_cnt,
+            'crash_cnt': self.crash_cnt,
+        }
+        save_checkpoint(self.checkpoint_path, payload)
+        self.checkpoint_time = time.time()
 
     def __clean_temp_dir(self):
+        self.queue_index.close()
+        self.concolic.shutdown()
+        self.afl_config.stop_forkserver()
+        if self.coordinator is not None:
+            self.coordinator.close()
         shutil.rmtree(self.tmp_dir)
 
+    def __watch_fuzzers(self):
+        for fuzzer_dir in self.queue_index.fuzzer_dirs():
+            self.afl_map.add_bitmap(fuzzer_dir.joinpath('fuzz_bitmap'))
+
     def __seek_trace_seeds(self):
         """Construct the trace corpus"""
         trace_list = list()
-        for seed in self.afl_config.afl_queue.glob('id:*'):
-            if seed.name in self.depot.traced_seeds:
+        self.queue_index.refresh()
+        self.__watch_fuzzers()
+        for seed in self.queue_index.untraced():
+            if utils.seed_key(seed.path) in self.depot.traced_seeds:
                 continue
-            trace_list.append(seed)
-            self.depot.traced_seeds.add(seed.name)
+            trace_list.append(seed.path)
+            self.depot.traced_seeds.add(utils.seed_key(seed.path))
         return trace_list
 
-    def __sync_seed(self, testcase, src_id, op='concolic'):
-        """Save if interesting"""
-        cov_increase = 0
-        testcase_bitmap, ret = self.afl_config.exec_showmap(testcase)
+    @staticmethod
+    def __store(testcase, seed_path):
+        with open(seed_path, 'wb') as fp:
+            fp.write(testcase)
+
+    def __save_testcase(self, testcase, src_id, op, ret, cov_increase):
+        """Store the testcase by its execution status"""
         if ret == 0:
-            cov_increase = self.afl_map.is_interesting(testcase_bitmap)
             if cov_increase != 0:
                 queue_idx = self.interesting_cnt
                 seed_path = self.concolic_queue.joinpath('id:%06d,src:%s,op:%s' % (queue_idx, src_id, op))
-                shutil.copy2(testcase, seed_path)
+                self.__store(testcase, seed_path)
                 self.logger.info(f'Interesting seed {seed_path.name}')
                 self.interesting_cnt += 1
         elif ret == 1:
             # timeout seed
             hang_idx = self.hang_cnt
             seed_path = self.concolic_hangs.joinpath('id:%06d,src:%s,op:%s' % (hang_idx, src_id, op))
-            shutil.copy2(testcase, seed_path)
+            self.__store(testcase, seed_path)
             self.hang_cnt += 1
         elif ret == 2:
             # crash seed
             crash_idx = self.crash_cnt
             seed_path = self.concolic_crash.joinpath('id:%06d,src:%s,op:%s' % (crash_idx, src_id, op))
-            shutil.copy2(testcase, seed_path)
+            self.__store(testcase, seed_path)
             self.crash_cnt += 1
-        return cov_increase
 
-    def __solve_seed(self, seed_input):
-        """Solve the seed by concolic execution"""
-        seed_name = seed_input.name
-        if seed_name in self.depot.solved_seeds:
+    def __sync_batch(self, testcases, src_id, op):
+        """Validate the testcases (bytes) and score their bitmaps at once, skip the duplicates"""
+        start = time.perf_counter()
+        cov_list = [0] * len(testcases)
+        passed = list()
+        trace_list = list()
+        exec_cnt = 0
+        for idx, testcase in enumerate(testcases):
+            if self.stopping.is_set():
+                # the executed testcases are still scored and saved below
+                break
+            key = content_hash(testcase)
+            if self.exec_cache.lookup(key) is not None:
+                continue
+            testcase_bitmap, ret = self.afl_config.exec_data(testcase)
+            exec_cnt += 1
+            cov_digest = None
+            if ret == 0:
+                cov_digest, known = self.exec_cache.known_coverage(testcase_bitmap)
+                if not known:
+                    passed.append(idx)
+                    trace_list.append(AFLMap.as_trace(testcase_bitmap))
+            else:
+                self.__save_testcase(testcase, src_id, op, ret, 0)
+            self.exec_cache.insert(key, ret, cov_digest)
+        if len(passed) > 0:
+            for idx, cov_increase in zip(passed, self.afl_map.batch_interesting(np.vstack(trace_list))):
+                cov_list[idx] = int(cov_increase)
+                self.__save_testcase(testcases[idx], src_id, op, 0, cov_list[idx])
+        self.telemetry.record('validate', time.perf_counter() - start, exec_cnt)
+        return cov_list
+
+    def __start_stages(self):
+        for target, name in ((self.__trace_stage, 'trace'), (self.__sample_stage, 'sample'),
+                             (self.__validate_stage, 'validate')):
+            stage = threading.Thread(target=target, name=f'cofuzz-{name}', daemon=True)
+            stage.start()
+            self.stages.append(stage)
+
+    def shutdown(self):
+        """Stop the stages, the validator stops between two executions so the counters stay consistent"""
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        self.new_seeds.set()
+        self.concolic.shutdown()
+        for stage_queue in (self.sample_queue, self.validate_queue):
+            # drop the pending work and wake the stage up
+            while True:
+                try:
+                    stage_queue.get_nowait()
+                    stage_queue.task_done()
+                except queue.Empty:
+                    break
+            try:
+                stage_queue.put_nowait(None)
+            except queue.Full:
+                # refilled meanwhile, the stage sees the stop flag at its next poll
+                pass
+        deadline = time.time() + STAGE_JOIN_TIMEOUT
+        for stage in self.stages:
+            stage.join(max(deadline - time.time(), 0))
+        self.tracer.close()
+        self.telemetry.write(self.counters())
+
+    def counters(self):
+        return {
+            'cycles_done': self.cycle_cnt,
+            'traced_seeds': len(self.depot.traced_seeds),
+            'partial_traces': self.tracer.partial_traces,
+            'solved_seeds': len(self.depot.solved_seeds),
+            'interesting_seeds': self.interesting_cnt,
+            'crash_seeds': self.crash_cnt,
+            'hang_seeds': self.hang_cnt,
+            'constraint_memo_hits': self.sampler.memo_hits,
+            'memo_hit_rate': round(self.sampler.memo_hit_rate, 4),
+            'duplicate_inputs': self.exec_cache.input_hits,
+            'cache_hit_rate': round(self.exec_cache.input_hit_rate, 4),
+            'claim_conflicts': 0 if self.coordinator is None else self.coordinator.conflicts,
+            **self.scheduler.counters(),
+        }
+
+    def __next_item(self, stage_queue):
+        """Next work item of a stage, None once the executor stops"""
+        while not self.stopping.is_set():
+            try:
+                item = stage_queue.get(timeout=QUEUE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if item is None:
+                # the wake-up of the shutdown
+                stage_queue.task_done()
+            return item
+        return None
+
+    def __put(self, stage_queue, item):
+        """Block while the next stage falls behind, give up once the executor stops"""
+        while not self.stopping.is_set():
+            try:
+                stage_queue.put(item, timeout=QUEUE_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def __drain(self):
+        """Wait until the sampler and the validator consume the dispatched work"""
+        for stage_queue in (self.sample_queue, self.validate_queue):
+            with stage_queue.all_tasks_done:
+                # a timed wait so SIGINT is handled while waiting
+                while stage_queue.unfinished_tasks > 0 and not self.stopping.is_set():
+                    stage_queue.all_tasks_done.wait(QUEUE_POLL_INTERVAL)
+
+    def __trace_stage(self):
+        """Trace the new seeds as soon as AFL saves them"""
+        while not self.stopping.is_set():
+            try:
+                with self.depot.lock:
+                    trace_list = self.__seek_trace_seeds()
+                if len(trace_list) > 0:
+                    with self.telemetry.stage('trace', len(trace_list)):
+                        self.tracer.trace_corpus(trace_list)
+                    self.logger.info(f'Finish tracing {len(trace_list)} seeds')
+                    self.new_seeds.set()
+            except Exception:
+                self.logger.exception('Tracing failed')
+            self.trace_ready.set()
+            # AFL saves a seed as a closed write, inotify wakes the stage right away
+            self.queue_index.wait(QUEUE_POLL_INTERVAL)
+
+    def __sample_stage(self):
+        """Turn the crack constraints into mutants, single thread as the z3 context is not thread-safe"""
+        try:
+            # load the solver while the corpus is traced instead of at the startup
+            self.sampler.load_backends()
+        except ImportError as e:
+            self.logger.warning(f'Sampler backend unavailable: {e}')
+        while True:
+            item = self.__next_item(self.sample_queue)
+            if item is None:
+                return
+            try:
+                if self.stopping.is_set():
+                    continue
+                seed_input, addr, constraint = item
+                mutants = self.sampler.crack_target(seed_input, constraint)
+                testcases = [mutant.tobytes() for mutant in mutants]
+                self.__put(self.validate_queue, (self.__validate_crack, (seed_input, addr, testcases)))
+            except Exception:
+                self.logger.exception('Sampling failed')
+            finally:
+                self.sample_queue.task_done()
+
+    def __validate_stage(self):
+        """The only stage executing the testcases and updating the counters"""
+        while True:
+            item = self.__next_item(self.validate_queue)
+            if item is None:
+                return
+            try:
+                if self.stopping.is_set():
+                    continue
+                validate, args = item
+                validate(*args)
+            except Exception:
+                self.logger.exception('Validation failed')
+            finally:
+                self.validate_queue.task_done()
+
+    def __validate_crack(self, seed_input, addr, testcases):
+        with self.telemetry.stage('bitmap'):
+            self.afl_map.update_bitmap()
+        self.label_cov[addr] += sum(self.__sync_batch(testcases, utils.identify_id(seed_input.name), op='crack'))
+
+    def __validate_solve(self, job, testcase):
+        seed_name = utils.seed_key(job.seed)
+        if testcase is not None:
+            if len(job.recent) == 0:
+                # Update the bitmap of edge hits
+                with self.telemetry.stage('bitmap'):
+                    self.afl_map.update_bitmap()
+            job.record(self.__sync_batch([testcase], utils.identify_id(job.seed.name), 'concolic')[0])
             return
-        self.logger.info(f'Concolic execution input={seed_name}')
-        # Running concolic execution
-        testcases, killed = self.concolic.solve(seed_input)
-        if killed:
+        if job.killed:
             self.logger.info(f'Timeout testcase {seed_name}')
-        # Update the bitmap of edge hits
-        self.afl_map.update_bitmap()
-        cur_cnt = self.interesting_cnt
-        for mutant in testcases:
-            self.__sync_seed(mutant, utils.identify_id(seed_name))
-        self.logger.info(f'Generate {len(testcases)} testcases')
-        self.logger.info(f'{self.interesting_cnt - cur_cnt} testcases are new')
-        self.depot.solved_seeds.add(seed_name)
-
-    def __crack_seed(self, seed_input, crack_addr):
-        """Crack the seed by sampler"""
-        seed_name = seed_input.name
-        src_id = utils.identify_id(seed_name)
-        # Crack the target
-        constraint_info = self.concolic.crack(seed_input, crack_addr)
-        constraint_dict = self.sampler.dump_constraint(constraint_info)
-        self.logger.info(f'Crack input: {seed_name}, addr: {str(crack_addr)}')
-        self.afl_map.update_bitmap()
-        cov_count = defaultdict(int)
-        for addr, constraints in constraint_dict.items():
-            # Start to crack the condition
-            for constraint in constraints:
-                testcases = self.sampler.crack_target(seed_input, constraint)
-                for mutant in testcases:
-                    cov_increase = self.__sync_seed(mutant, src_id, op='crack')
-                    cov_count[addr] += cov_increase
-        return cov_count
-
-    def __solve_random(self):
-        unsolved_seeds = list()
-        for seed in self.afl_config.afl_queue.glob('id:*'):
-            if seed.name in self.depot.solved_seeds:
+        if job.stopped:
+            self.logger.info(f'Stop {seed_name} on low yield')
+        self.logger.info(f'Generate {job.generated} testcases from {seed_name}')
+        self.logger.info(f'{job.new_cov} testcases are new')
+        with self.depot.lock:
+            self.depot.solved_seeds.add(seed_name)
+            self.queue_index.mark_solved(seed_name)
+        if self.coordinator is not None:
+            self.coordinator.record('solve', seed_name)
+
+    def __solve_seeds(self, seed_list, limit=None):
+        """Solve at most limit of the seeds by concolic execution"""
+        unsolved_list = list()
+        with self.depot.lock:
+            for seed_input in seed_list:
+                if limit is not None and len(unsolved_list) >= limit:
+                    break
+                key = utils.seed_key(seed_input)
+                if key in self.depot.solved_seeds:
+                    self.queue_index.mark_solved(key)
+                    continue
+                if self.coordinator is not None and not self.coordinator.claim('solve', key):
+                    # solving by another instance
+                    continue
+                self.logger.info(f'Concolic execution input={key}')
+                unsolved_list.append(seed_input)
+        # Running concolic execution, the testcases are validated while SymCC keeps generating
+        for job, testcase in self.concolic.solve(unsolved_list, self.scheduler.timeout('solve')):
+            self.__put(self.validate_queue, (self.__validate_solve, (job, testcase)))
+        return len(unsolved_list)
+
+    def __crack_seeds(self, candidate):
+        """Crack the seeds by sampler, each constraint is sampled while SymCC keeps running"""
+        block_count = defaultdict(int)
+        for seed_input, crack_addr, block in self.concolic.crack(candidate.items(), self.scheduler.timeout('crack')):
+            seed_name = utils.seed_key(seed_input)
+            if block is None:
+                self.logger.info(f'Crack input: {seed_name}, addr: {str(crack_addr)}, '
+                                 f'{block_count.pop(seed_name, 0)} constraints')
                 continue
-            unsolved_seeds.append(seed)
-        if len(unsolved_seeds) == 0:
+            block_count[seed_name] += 1
+            addr, constraint = block
+            self.__put(self.sample_queue, (seed_input, addr, constraint))
+        return len(candidate)
+
+    def __run_mode(self, mode, run):
+        """Run the mode until its testcases are validated, credit it with the new seeds per CPU-second"""
+        start = time.time()
+        cpu_start = cpu_time()
+        interesting_cnt = self.interesting_cnt
+        seeds = run()
+        self.__drain()
+        self.scheduler.observe(self.concolic.pop_runs())
+        self.scheduler.update(mode, seeds, self.interesting_cnt - interesting_cnt, cpu_time() - cpu_start,
+                              time.time() - start, self.concolic.jobs)
+        return seeds
+
+    def __learn(self):
+        """Fit the edge model on the coverage of the cracks"""
+        label_cov, self.label_cov = self.label_cov, defaultdict(int)
+        self.logger.info(f'Validation cache: {self.exec_cache.stats()}')
+        self.logger.info(f'Constraint memo: {self.sampler.memo_stats()}')
+        with self.depot.lock:
+            with self.telemetry.stage('model', len(label_cov)):
+                self.depot.update_model(label_cov)
+
+    def __schedule(self):
+        """One cycle: crack, solve and random solve within the shares of the budget, then learn from the coverage"""
+        self.cycle_cnt += 1
+        limits = self.scheduler.plan(self.concolic.jobs)
+        with self.depot.lock:
+            if self.coordinator is not None:
+                self.coordinator.sync(self.depot, self.queue_index)
+            # update the basic block hits
+            with self.telemetry.stage('bitmap'):
+                self.depot.resolve_fuzz_hits([fuzzer_dir.joinpath('bb_bitmap')
+                                              for fuzzer_dir in self.queue_index.fuzzer_dirs()])
+            # resolve the seed candidate
+            with self.telemetry.stage('rank'):
+                candidate = self.depot.concolic_candidate(seed_limit=limits['crack'])
+        if self.coordinator is not None:
+            candidate = self.coordinator.claim_cracks(candidate)
+        self.logger.info(f'Candidate size: {len(candidate.keys())}')
+        dispatched = 0
+        if len(candidate) > 0:
+            # the sampler and the validator work on the cracks while SymCC keeps running
+            with self.telemetry.stage('crack', len(candidate)):
+                dispatched += self.__run_mode('crack', lambda: self.__crack_seeds(candidate))
+            self.__learn()
+            with self.telemetry.stage('solve', len(candidate)):
+                dispatched += self.__run_mode('solve', lambda: self.__solve_seeds(list(candidate.keys()),
+                                                                                   limits['solve']))
+        with self.depot.lock:
+            unsolved_seeds = [seed.path for seed in self.queue_index.unsolved(limits['random'])]
+        if len(unsolved_seeds) > 0:
+            with self.telemetry.stage('solve', len(unsolved_seeds)):
+                dispatched += self.__run_mode('random', lambda: self.__solve_seeds(unsolved_seeds))
+        self.logger.info(f'Schedule: {self.scheduler.summary()}')
+        if dispatched == 0:
+            # nothing left, or the other instances are working on the rest
             self.logger.info('Waiting for new testcases...')
-            time.sleep(60)
-            return
-        unsolved_seeds.sort(key=lambda x: testcase_core(x), reverse=True)
-        random_num = min(len(unsolved_seeds), RAND_SOLVE_NUM)
-        for idx in range(random_num):
-            self.__solve_seed(unsolved_seeds[idx])
+            self.new_seeds.wait(QUEUE_WAIT_TIMEOUT)
+            self.new_seeds.clear()
 
     def run(self):
-        """Main loop"""
+        """Main loop, tracing, sampling and validation run as pipeline stages next to the scheduler"""
         self.logger.info(f'CoFuzz starts in {self.tmp_dir}')
-        while True:
-            # trace the seeds
-            trace_list = self.__seek_trace_seeds()
-            self.tracer.trace_corpus(trace_list)
-            self.logger.info(f'Finish tracing {len(trace_list)} seeds')
-            # update the basic block hits
-            self.depot.resolve_fuzz_hits(self.afl_config.bb_bitmap)
-            # resolve the seed candidate
-            candidate = self.depot.concolic_candidate()
-            self.logger.info(f'Candidate size: {len(candidate.keys())}')
-            if len(candidate) == 0:
-                self.logger.info(f'No candidate, concolic execute random seed')
-                self.__solve_random()
-                continue
-            # start the concolic execution
-            label_cov = defaultdict(int)
-            for seed_input, crack_addr in candidate.items():
-                cov_count = self.__crack_seed(seed_input, crack_addr)
-                for addr in cov_count:
-                    label_cov[addr] += cov_count[addr]
-                self.__solve_seed(seed_input)
-            self.depot.update_model(label_cov)
+        self.__start_stages()
+        try:
+            # rank the edges after the first pass over the corpus
+            self.trace_ready.wait()
+            # the first cycle covers the initial corpus, only the seeds traced later wake an idle wait
+            self.new_seeds.clear()
+            while not self.stopping.is_set():
+                self.__schedule()
+                self.telemetry.maybe_write(self.counters())
+                if time.time() - self.checkpoint_time >= CHECKPOINT_INTERVAL:
+                    self.checkpoint()
+        finally:
+            self.shutdown()
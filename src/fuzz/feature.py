@@ -0,0 +1,53 @@
+import numpy as np
+
+from fuzz.config import EDGE_FEATURE_NUM
+
+
+class FeatureMatrix:
+    def __init__(self, capacity=1024):
+        """Edge features of the execution tree, one row per node, refreshed only for the touched nodes"""
+        self.size = 0
+        self.rows = dict()  # addr -> row
+        self.addrs = np.zeros(capacity, dtype=np.int64)
+        self.features = np.zeros((capacity, EDGE_FEATURE_NUM), dtype=int)
+        self.cracked = np.zeros(capacity, dtype=np.int64)
+        self.dirty = set()
+
+    def __grow(self):
+        capacity = 2 * len(self.addrs)
+        self.addrs = np.resize(self.addrs, capacity)
+        self.features = np.resize(self.features, (capacity, EDGE_FEATURE_NUM))
+        self.cracked = np.resize(self.cracked, capacity)
+
+    def row(self, addr):
+        row = self.rows.get(addr)
+        if row is None:
+            if self.size == len(self.addrs):
+                self.__grow()
+            row = self.size
+            self.size += 1
+            self.rows[addr] = row
+            self.addrs[row] = addr
+            self.cracked[row] = 0
+        return row
+
+    def touch(self, addrs):
+        """The nodes changed their children or distance"""
+        self.dirty.update(addrs)
+
+    def sync(self, cov_state):
+        for addr in self.dirty:
+            cond_node = cov_state[addr]
+            row = self.row(addr)
+            self.features[row] = cond_node.edge_feature()
+        self.dirty.clear()
+
+    def add_crack(self, addr, count=1):
+        self.cracked[self.row(addr)] += count
+
+    def matrix(self, rows, blk_hit):
+        """Feature vectors of the rows with the basic block hits as the last column"""
+        return np.column_stack([self.features[rows], blk_hit[self.addrs[rows]]])
+
+    def row_of(self, addrs):
+        return np.fromiter((self.rows[addr] for addr in addrs), dtype=np.int64, count=len(addrs))
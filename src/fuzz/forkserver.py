@@ -0,0 +1,165 @@
+import ctypes
+import os
+import select
+import signal
+import struct
+from shlex import split
+
+import numpy as np
+
+from fuzz.config import FORKSRV_FD, MAP_SIZE, SHOWMAP_TIMEOUT
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_EXCL = 0o2000
+IPC_RMID = 0
+
+
+class ForkServerError(Exception):
+    pass
+
+
+class SharedMap:
+    def __init__(self, map_size=MAP_SIZE):
+        """SysV shared memory segment for the AFL trace bits"""
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.shmat.restype = ctypes.c_void_p
+        self.libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        self.libc.shmdt.argtypes = [ctypes.c_void_p]
+        self.shm_id = self.libc.shmget(IPC_PRIVATE, ctypes.c_size_t(map_size), IPC_CREAT | IPC_EXCL | 0o600)
+        if self.shm_id < 0:
+            raise ForkServerError(f'shmget failed: {os.strerror(ctypes.get_errno())}')
+        self.shm_addr = self.libc.shmat(self.shm_id, None, 0)
+        if self.shm_addr in [None, ctypes.c_void_p(-1).value]:
+            self.libc.shmctl(self.shm_id, IPC_RMID, None)
+            raise ForkServerError(f'shmat failed: {os.strerror(ctypes.get_errno())}')
+        # zero-copy view of the segment
+        self.trace_bits = np.ctypeslib.as_array((ctypes.c_uint8 * map_size).from_address(self.shm_addr))
+
+    def clear(self):
+        self.trace_bits[:] = 0
+
+    def close(self):
+        if self.shm_addr is None:
+            return
+        self.trace_bits = None
+        self.libc.shmdt(ctypes.c_void_p(self.shm_addr))
+        self.libc.shmctl(self.shm_id, IPC_RMID, None)
+        self.shm_addr = None
+
+
+class ForkServer:
+    def __init__(self, target_cmd, input_path, timeout=SHOWMAP_TIMEOUT):
+        """Persistent executor speaking the AFL forkserver protocol"""
+        self.input_path = input_path
+        self.timeout = timeout / 1000
+        self.use_stdin = '@@' not in target_cmd
+        self.target_cmd = split(target_cmd.replace('@@', str(input_path)))
+        self.shared_map = SharedMap()
+        try:
+            self.input_fd = os.open(input_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        except BaseException:
+            # the segment outlives the process unless removed
+            self.shared_map.close()
+            raise
+        self.pid = None
+        self.ctl_fd = None
+        self.st_fd = None
+        self.child_pid = -1
+        self.prev_timed_out = False
+
+    def __target_env(self):
+        target_env = dict(os.environ)
+        target_env['__AFL_SHM_ID'] = str(self.shared_map.shm_id)
+        target_env['ASAN_OPTIONS'] = 'abort_on_error=1:detect_leaks=0:symbolize=0:allocator_may_return_null=1'
+        target_env['MSAN_OPTIONS'] = 'exit_code=86:symbolize=0:abort_on_error=1:allocator_may_return_null=1'
+        return target_env
+
+    def __read_status(self, timeout):
+        """Read a 4-byte message from the status pipe"""
+        ready, _, _ = select.select([self.st_fd], [], [], timeout)
+        if len(ready) == 0:
+            return None
+        data = os.read(self.st_fd, 4)
+        if len(data) != 4:
+            raise ForkServerError('Forkserver pipe closed')
+        return struct.unpack('I', data)[0]
+
+    def start(self):
+        ctl_read, ctl_write = os.pipe()
+        st_read, st_write = os.pipe()
+        # posix_spawn runs no Python code in the child, so a validator thread may restart the forkserver;
+        # the file actions pass only the pipes and the stdio to the target, the other descriptors are non-inheritable
+        stdin = (os.POSIX_SPAWN_DUP2, self.input_fd, 0) if self.use_stdin else \
+            (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0)
+        file_actions = [(os.POSIX_SPAWN_DUP2, ctl_read, FORKSRV_FD), (os.POSIX_SPAWN_DUP2, st_write, FORKSRV_FD + 1),
+                        stdin, (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                        (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0)]
+        # close() releases our ends if the spawn fails
+        self.ctl_fd = ctl_write
+        self.st_fd = st_read
+        try:
+            self.pid = os.posix_spawnp(self.target_cmd[0], self.target_cmd, self.__target_env(),
+                                       file_actions=file_actions, setsid=True)
+        finally:
+            os.close(ctl_read)
+            os.close(st_write)
+        # wait for the hello message
+        if self.__read_status(10 * self.timeout) is None:
+            self.close()
+            raise ForkServerError('Timeout while initializing the forkserver')
+
+    def __write_input(self, testcase):
+        if isinstance(testcase, bytes):
+            data = testcase
+        else:
+            with open(testcase, 'rb') as fp:
+                data = fp.read()
+        os.lseek(self.input_fd, 0, os.SEEK_SET)
+        os.write(self.input_fd, data)
+        os.ftruncate(self.input_fd, len(data))
+        os.lseek(self.input_fd, 0, os.SEEK_SET)
+
+    def run(self, testcase):
+        """Execute a testcase (path or bytes), return the raw trace bits and showmap-style status"""
+        self.__write_input(testcase)
+        self.shared_map.clear()
+        os.write(self.ctl_fd, struct.pack('I', int(self.prev_timed_out)))
+        self.child_pid = self.__read_status(self.timeout)
+        if self.child_pid is None or self.child_pid <= 0:
+            raise ForkServerError('Unable to request new process from forkserver')
+        status = self.__read_status(self.timeout)
+        timed_out = status is None
+        if timed_out:
+            try:
+                os.kill(self.child_pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            status = self.__read_status(self.timeout)
+            if status is None:
+                raise ForkServerError('Forkserver lost the timeout child')
+        self.prev_timed_out = timed_out
+        trace_bits = self.shared_map.trace_bits
+        if timed_out:
+            return trace_bits, 1
+        if os.WIFSIGNALED(status) or (os.WIFEXITED(status) and os.WEXITSTATUS(status) == 86):
+            return trace_bits, 2
+        return trace_bits, 0
+
+    def close(self):
+        for fd in [self.ctl_fd, self.st_fd]:
+            if fd is not None:
+                os.close(fd)
+        self.ctl_fd = self.st_fd = None
+        if self.pid is not None:
+            try:
+                # the session also holds the child of a pending execution
+                os.killpg(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(self.pid, 0)
+            self.pid = None
+        if self.input_fd is not None:
+            os.close(self.input_fd)
+            self.input_fd = None
+        self.shared_map.close()
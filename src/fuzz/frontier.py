@@ -0,0 +1,96 @@
+import random
+
+import numpy as np
+
+
+class SeedReservoir:
+    __slots__ = ['unsolved', 'solved']
+
+    def __init__(self):
+        """Seeds of an edge not cracked on it yet, ids in StateDepot.seed_table"""
+        self.unsolved = list()
+        self.solved = list()
+
+    def __len__(self):
+        return len(self.unsolved) + len(self.solved)
+
+
+def pop_random(seed_ids):
+    """Swap a random item to the end and pop it"""
+    idx = random.randrange(len(seed_ids))
+    seed_ids[idx], seed_ids[-1] = seed_ids[-1], seed_ids[idx]
+    return seed_ids.pop()
+
+
+class FrontierIndex:
+    def __init__(self, capacity=1024):
+        """Uncovered edges with untried seeds, updated in place by the tracer and the candidate selection"""
+        self.rows = np.zeros(capacity, dtype=np.int64)  # rows of the FeatureMatrix, packed
+        self.size = 0
+        self.slots = dict()  # row -> position in rows
+        self.reservoirs = dict()  # row -> SeedReservoir, the uncovered edges only
+
+    def __insert(self, row):
+        if row in self.slots:
+            return
+        if self.size == len(self.rows):
+            self.rows = np.resize(self.rows, 2 * len(self.rows))
+        self.rows[self.size] = row
+        self.slots[row] = self.size
+        self.size += 1
+
+    def __remove(self, row):
+        slot = self.slots.pop(row, None)
+        if slot is None:
+            return
+        self.size -= 1
+        last = self.rows[self.size]
+        if slot != self.size:
+            self.rows[slot] = last
+            self.slots[int(last)] = slot
+
+    def add_seed(self, row, seed_id, solved=False):
+        reservoir = self.reservoirs.get(row)
+        if reservoir is None:
+            reservoir = self.reservoirs[row] = SeedReservoir()
+        (reservoir.solved if solved else reservoir.unsolved).append(seed_id)
+        self.__insert(row)
+
+    def cover(self, row):
+        """The edge has all its successors, it leaves the frontier for good"""
+        if self.reservoirs.pop(row, None) is not None:
+            self.__remove(row)
+
+    def take(self, row, count, is_solved, is_tried):
+        """Draw up to count seeds of the edge, the unsolved ones first
+
+        Seeds solved since they were added move to the solved list when drawn,
+        seeds cracked on the edge by another instance are dropped when drawn.
+        """
+        reservoir = self.reservoirs.get(row)
+        if reservoir is None:
+            return list()
+        picked = list()
+        while len(picked) < count and len(reservoir.unsolved) > 0:
+            seed_id = pop_random(reservoir.unsolved)
+            if is_tried(seed_id):
+                continue
+            if is_solved(seed_id):
+                reservoir.solved.append(seed_id)
+                continue
+            picked.append(seed_id)
+        while len(picked) < count and len(reservoir.solved) > 0:
+            seed_id = pop_random(reservoir.solved)
+            if not is_tried(seed_id):
+                picked.append(seed_id)
+        if len(reservoir) == 0:
+            # back on the frontier once a new seed reaches the edge
+            self.__remove(row)
+        return picked
+
+    def edges(self):
+        """Rows of the frontier edges, a view valid until the next update"""
+        return self.rows[:self.size]
+
+    def __len__(self):
+        return self.size
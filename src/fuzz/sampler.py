@@ -1,8 +1,8 @@
 from argparse import ArgumentTypeError
 
 import numpy as np
-from scipy.optimize import linprog
-from six.moves import range
+
+from fuzz.config import DEFAULT_SAMPLER_CHAINS, DIKIN_BATCH_FLOATS
 
 
 def hessian(a, b, x):
@@ -92,6 +92,7 @@ def hit_and_run(a, b, x0):
 
 def chebyshev_center(a, b):
     """Return Chebyshev center of the convex polytope."""
+    from scipy.optimize import linprog
     norm_vector = np.reshape(np.linalg.norm(a, axis=1), (a.shape[0], 1))
     c = np.zeros(a.shape[1] + 1)
     c[-1] = -1
@@ -125,34 +126,113 @@ def collect_chain(sampler, count, burn, thin, *args, **kwargs):
     return points
 
 
-def do_sample(leq, leq_rhs, count=100, burn=1000, thin=10, sampler='hit-and-run'):
+def box_bounds(a, b, tol=1e-9):
+    """Return (lower, upper) if every row of a is a signed unit vector, otherwise None."""
+    nonzero = np.abs(a) > tol
+    if not (np.count_nonzero(nonzero, axis=1) == 1).all():
+        return None
+    col = np.argmax(nonzero, axis=1)
+    coef = a[np.arange(a.shape[0]), col]
+    bound = b / coef
+    upper = np.full(a.shape[1], np.inf)
+    lower = np.full(a.shape[1], -np.inf)
+    np.minimum.at(upper, col[coef > 0], bound[coef > 0])
+    np.maximum.at(lower, col[coef < 0], bound[coef < 0])
+    if not (np.isfinite(lower).all() and np.isfinite(upper).all()):
+        return None
+    return lower, upper
+
+
+def sample_box(lower, upper, count, rng=None):
+    """Draw integer points uniformly from the box, no chain is needed."""
+    rng = np.random.default_rng() if rng is None else rng
+    lower = np.ceil(lower).astype(np.int64)
+    upper = np.floor(upper).astype(np.int64)
+    if (lower > upper).any():
+        raise Exception('Empty integer box')
+    return rng.integers(lower, upper + 1, size=(count, len(lower)))
+
+
+def hit_and_run_chains(a, b, x0, count, chains, burn, thin, rng=None):
+    """Hit-and-run with all the chains advanced in one vectorized step."""
+    rng = np.random.default_rng() if rng is None else rng
+    x = np.tile(np.asarray(x0, dtype=float), (chains, 1))
+    steps = burn + -(-count // chains) * thin
+    points = list()
+    for step in range(steps):
+        # Generate points on the sphere surface
+        d = rng.normal(size=x.shape)
+        d /= np.linalg.norm(d, axis=1, keepdims=True)
+
+        # Find the chord through x in the direction
+        ad = d.dot(a.T)
+        slack = b - x.dot(a.T)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dist = slack / ad
+        t_max = np.where(ad > 0, dist, np.inf).min(axis=1)
+        t_min = np.where(ad < 0, dist, -np.inf).max(axis=1)
+        x = x + d * rng.uniform(t_min, t_max)[:, np.newaxis]
+
+        if step >= burn and (step - burn + 1) % thin == 0:
+            points.append(x)
+    return np.vstack(points)[:count]
+
+
+def barrier_factor(a, b, x):
+    """Cholesky factor and log-determinant of the log-barrier Hessian at each row of x."""
+    scaled = a[np.newaxis] / (b - x.dot(a.T))[:, :, np.newaxis]
+    h = np.matmul(scaled.transpose(0, 2, 1), scaled)
+    chol = np.linalg.cholesky(h)
+    logdet = 2 * np.log(np.diagonal(chol, axis1=1, axis2=2)).sum(axis=1)
+    return chol, logdet
+
+
+def dikin_chains(a, b, x0, count, chains, burn, thin, r=3 / 40, rng=None):
+    """Lazy Dikin walk with all the chains advanced in one vectorized step.
+
+    The factor of the current point is kept until a proposal is accepted, so each
+    step factors the Hessian at the proposals only, and only for the moving chains.
+    Large polytopes run fewer chains, one step scales at most DIKIN_BATCH_FLOATS rows.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    chains = max(1, min(chains, DIKIN_BATCH_FLOATS // (a.shape[0] * a.shape[1] ** 2)))
+    x = np.tile(np.asarray(x0, dtype=float), (chains, 1))
+    dim = x.shape[1]
+    chol_x, logdet_x = barrier_factor(a, b, x)
+    steps = burn + -(-count // chains) * thin
+    points = list()
+    for step in range(steps):
+        move = np.flatnonzero(rng.uniform(size=chains) < 0.5)
+        if len(move) > 0:
+            # uniform point of the Dikin ellipsoid {z: (z - x)^T H (z - x) <= r}, H = L L^T
+            u = rng.normal(size=(len(move), dim))
+            u *= (rng.uniform(size=len(move)) ** (1.0 / dim) / np.linalg.norm(u, axis=1))[:, np.newaxis]
+            delta = np.sqrt(r) * np.linalg.solve(chol_x[move].transpose(0, 2, 1), u[:, :, np.newaxis])[:, :, 0]
+            z = x[move] + delta
+            inside = (z.dot(a.T) < b).all(axis=1)
+            move, z, delta = move[inside], z[inside], delta[inside]
+            if len(move) > 0:
+                chol_z, logdet_z = barrier_factor(a, b, z)
+                # x has to be in the ellipsoid of z as well
+                back = np.matmul(chol_z.transpose(0, 2, 1), delta[:, :, np.newaxis])[:, :, 0]
+                accept = (np.square(back).sum(axis=1) <= r) & \
+                         (np.log(rng.uniform(size=len(move))) < (logdet_z - logdet_x[move]) / 2)
+                move = move[accept]
+                x[move], chol_x[move], logdet_x[move] = z[accept], chol_z[accept], logdet_z[accept]
+
+        if step >= burn and (step - burn + 1) % thin == 0:
+            points.append(x.copy())
+    return np.vstack(points)[:count]
+
+
+def do_sample(leq, leq_rhs, count=100, burn=1000, thin=10, sampler='hit-and-run', chains=DEFAULT_SAMPLER_CHAINS):
     """Entry point."""
-    # Find nullspace
-
-    vh = np.identity(leq.shape[1])
-
-    nullity = vh.shape[0]
-    nullspace = vh[-nullity:].T
-
-    # Polytope parameters
-    a = leq.dot(nullspace)
-    b = leq_rhs
-
     # Initial point to start the chains from.
     # Use the Chebyshev center.
-    x0 = chebyshev_center(a, b)
+    x0 = chebyshev_center(leq, leq_rhs)
 
+    if sampler == 'hit-and-run':
+        return hit_and_run_chains(leq, leq_rhs, x0, count, chains, burn, thin)
     if sampler == 'dikin':
-        sampler = dikin_walk
-        dikin_radius = 1
-        sampler_args = (dikin_radius,)
-    elif sampler == 'hit-and-run':
-        sampler = hit_and_run
-        sampler_args = ()
-    else:
-        raise ArgumentTypeError('Invalid sampler: {}'.format(sampler))
-
-    chain = collect_chain(sampler, count, burn, thin, a, b, x0, *sampler_args)
-    res = chain.dot(nullspace.T)
-
-    return res
+        return dikin_chains(leq, leq_rhs, x0, count, chains, burn, thin)
+    raise ArgumentTypeError('Invalid sampler: {}'.format(sampler))
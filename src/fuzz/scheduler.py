@@ -0,0 +1,115 @@
+import math
+from collections import deque
+
+import numpy as np
+
+from fuzz.config import BANDIT_DECAY, BANDIT_EXPLORATION, BANDIT_MIN_SHARE, CONCOLIC_TIMEOUT, CYCLE_BUDGET, \
+    MIN_CONCOLIC_TIMEOUT, RAND_SOLVE_NUM, TIMEOUT_MIN_RUNS, TIMEOUT_QUANTILE, TIMEOUT_SLACK, TIMEOUT_WINDOW
+
+MODES = ('crack', 'solve', 'random')
+# SymCC runs of the random mode are solve runs
+RUN_KINDS = ('crack', 'solve')
+
+
+class ModeStats:
+    __slots__ = ['pulls', 'seeds', 'new_cov', 'cpu', 'reward', 'seed_cost']
+
+    def __init__(self):
+        """Outcome of a scheduling mode, the reward is the new coverage per CPU-second"""
+        self.pulls = 0
+        self.seeds = 0
+        self.new_cov = 0
+        self.cpu = 0.0
+        self.reward = 0.0  # moving average, the coverage of a mode dries up as the campaign goes
+        self.seed_cost = None  # worker-seconds per seed
+
+    def update(self, seeds, new_cov, cpu, cost):
+        reward = new_cov / max(cpu, 1e-3)
+        if self.pulls == 0:
+            self.reward, self.seed_cost = reward, cost
+        else:
+            self.reward += BANDIT_DECAY * (reward - self.reward)
+            self.seed_cost += BANDIT_DECAY * (cost - self.seed_cost)
+        self.pulls += 1
+        self.seeds += seeds
+        self.new_cov += new_cov
+        self.cpu += cpu
+
+
+class ModeScheduler:
+    def __init__(self, budget=CYCLE_BUDGET):
+        """Split the time budget of a cycle among the modes, UCB1 over their new coverage per CPU-second"""
+        self.budget = budget
+        self.modes = {mode: ModeStats() for mode in MODES}
+        self.runtimes = {kind: deque(maxlen=TIMEOUT_WINDOW) for kind in RUN_KINDS}
+
+    def shares(self):
+        """Fraction of the budget of each mode, every mode keeps a floor so it is still explored"""
+        total = sum(stats.pulls for stats in self.modes.values())
+        best = max(max(stats.reward for stats in self.modes.values()), 1e-9)
+        scores = list()
+        for stats in self.modes.values():
+            bonus = BANDIT_EXPLORATION * math.sqrt(math.log(total + 1) / max(stats.pulls, 1))
+            # the untried modes rank as the best one
+            mean = 1.0 if stats.pulls == 0 else stats.reward / best
+            scores.append(mean + bonus)
+        free = 1.0 - BANDIT_MIN_SHARE * len(MODES)
+        return {mode: BANDIT_MIN_SHARE + free * score / sum(scores) for mode, score in zip(MODES, scores)}
+
+    def plan(self, jobs):
+        """Seed limit of each mode, None when unbounded, the modes without a cost estimate run as usual"""
+        limits = dict()
+        for mode, share in self.shares().items():
+            seed_cost = self.modes[mode].seed_cost
+            if seed_cost is None:
+                limits[mode] = RAND_SOLVE_NUM * jobs if mode == 'random' else None
+            else:
+                limits[mode] = max(1, int(share * self.budget * jobs / max(seed_cost, 1e-3)))
+        return limits
+
+    def update(self, mode, seeds, new_cov, cpu, wall, jobs):
+        if seeds == 0:
+            return
+        self.modes[mode].update(seeds, new_cov, cpu, wall * jobs / seeds)
+
+    def observe(self, runs):
+        """Wall time of the finished SymCC runs, a killed run counts with its timeout"""
+        for kind, elapsed in runs:
+            self.runtimes[kind].append(elapsed)
+
+    def timeout(self, kind):
+        """Concolic timeout from the observed runtimes, the upper quantile with some slack"""
+        runtimes = self.runtimes[kind]
+        if len(runtimes) < TIMEOUT_MIN_RUNS:
+            return CONCOLIC_TIMEOUT
+        timeout = np.percentile(np.fromiter(runtimes, dtype=float), TIMEOUT_QUANTILE) * TIMEOUT_SLACK
+        return int(math.ceil(min(max(timeout, MIN_CONCOLIC_TIMEOUT), CONCOLIC_TIMEOUT)))
+
+    def counters(self):
+        counters = dict()
+        for mode, share in self.shares().items():
+            counters[f'{mode}_share'] = round(share, 3)
+            counters[f'{mode}_cov_per_cpu_sec'] = round(self.modes[mode].reward, 4)
+        for kind in RUN_KINDS:
+            counters[f'{kind}_timeout'] = self.timeout(kind)
+        return counters
+
+    def summary(self):
+        modes = ', '.join(f'{mode} {share:.0%} ({self.modes[mode].reward:.3f}/cpu-s)'
+                          for mode, share in self.shares().items())
+        timeouts = ', '.join(f'{kind} {self.timeout(kind)}s' for kind in RUN_KINDS)
+        return f'{modes}; timeout {timeouts}'
+
+    def snapshot(self):
+        return {
+            'modes': {mode: [getattr(stats, slot) for slot in ModeStats.__slots__]
+                      for mode, stats in self.modes.items()},
+            'runtimes': {kind: list(runtimes) for kind, runtimes in self.runtimes.items()},
+        }
+
+    def restore(self, state):
+        for mode, values in state['modes'].items():
+            for slot, value in zip(ModeStats.__slots__, values):
+                setattr(self.modes[mode], slot, value)
+        for kind, runtimes in state['runtimes'].items():
+            self.runtimes[kind].extend(runtimes)
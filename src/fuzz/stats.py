@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from fuzz.config import STATS_INTERVAL, STATS_WINDOW
+
+STAGES = ('trace', 'bitmap', 'rank', 'crack', 'z3', 'sample', 'validate', 'solve', 'model')
+QUANTILES = (50, 90, 99)
+
+
+def cpu_time():
+    """CPU seconds of CoFuzz and its finished children (tracer, SymCC, target)"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageStats:
+    __slots__ = ['count', 'total', 'items', 'recent']
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.items = 0
+        self.recent = deque(maxlen=STATS_WINDOW)  # latest latencies for the percentiles
+
+    def percentiles(self):
+        if len(self.recent) == 0:
+            return [0.0] * len(QUANTILES)
+        return np.percentile(np.fromiter(self.recent, dtype=float), QUANTILES).tolist()
+
+
+class Telemetry:
+    def __init__(self, out_dir=None, prometheus=None):
+        """Per-stage timing, written like fuzzer_stats and plot_data of AFL"""
+        self.stats_file = None if out_dir is None else out_dir.joinpath('cofuzz_stats')
+        self.plot_file = None if out_dir is None else out_dir.joinpath('plot_data')
+        self.prom_file = prometheus
+        self.stages = {name: StageStats() for name in STAGES}
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.start_cpu = cpu_time()
+        self.last_write = 0
+
+    def record(self, name, elapsed, items=0):
+        with self.lock:
+            stage = self.stages[name]
+            stage.count += 1
+            stage.total += elapsed
+            stage.items += items
+            stage.recent.append(elapsed)
+
+    @contextmanager
+    def stage(self, name, items=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, items)
+
+    def summary(self, counters):
+        """Flat view of the stages and the executor counters"""
+        run_time = max(time.time() - self.start_time, 1e-6)
+        cpu_used = max(cpu_time() - self.start_cpu, 1e-6)
+        execs = self.stages['validate'].items
+        summary = {
+            'start_time': int(self.start_time),
+            'last_update': int(time.time()),
+            'run_time': int(run_time),
+            'cpu_time': round(cpu_used, 2),
+            'execs_done': execs,
+            'execs_per_sec': round(execs / run_time, 2),
+        }
+        summary.update(counters)
+        summary['new_cov_per_cpu_sec'] = round(counters.get('interesting_seeds', 0) / cpu_used, 4)
+        with self.lock:
+            for name, stage in self.stages.items():
+                summary[f'{name}_count'] = stage.count
+                summary[f'{name}_items'] = stage.items
+                summary[f'{name}_total_ms'] = round(stage.total * 1000, 1)
+                for quantile, value in zip(QUANTILES, stage.percentiles()):
+                    summary[f'{name}_p{quantile}_ms'] = round(value * 1000, 2)
+        return summary
+
+    @staticmethod
+    def __replace(path, content):
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        with open(tmp_path, 'w') as fp:
+            fp.write(content)
+        os.replace(tmp_path, path)
+
+    def __write_plot(self, summary):
+        columns = ['last_update', 'run_time', 'execs_done', 'execs_per_sec', 'interesting_seeds', 'crash_seeds',
+                   'hang_seeds', 'cpu_time'] + [f'{name}_total_ms' for name in STAGES]
+        new_file = not self.plot_file.exists()
+        with open(self.plot_file, 'a') as fp:
+            if new_file:
+                fp.write(f"# {', '.join(columns)}\n")
+            fp.write(', '.join(str(summary.get(column, 0)) for column in columns) + '\n')
+
+    def __write_prometheus(self, summary):
+        lines = list()
+        for key in ['run_time', 'cpu_time', 'execs_done', 'execs_per_sec', 'interesting_seeds', 'crash_seeds',
+                    'hang_seeds', 'new_cov_per_cpu_sec', 'cache_hit_rate', 'memo_hit_rate']:
+            lines.append(f'cofuzz_{key} {summary.get(key, 0)}')
+        lines.append('# TYPE cofuzz_stage_seconds summary')
+        for name in STAGES:
+            for quantile in QUANTILES:
+                lines.append(f'cofuzz_stage_seconds{{stage="{name}",quantile="{quantile / 100}"}} '
+                             f"{round(summary[f'{name}_p{quantile}_ms'] / 1000, 6)}")
+            lines.append(f'cofuzz_stage_seconds_sum{{stage="{name}"}} {round(summary[f"{name}_total_ms"] / 1000, 6)}')
+            lines.append(f'cofuzz_stage_seconds_count{{stage="{name}"}} {summary[f"{name}_count"]}')
+        lines.append('# TYPE cofuzz_stage_items_total counter')
+        for name in STAGES:
+            lines.append(f'cofuzz_stage_items_total{{stage="{name}"}} {summary[f"{name}_items"]}')
+        self.__replace(self.prom_file, '\n'.join(lines) + '\n')
+
+    def write(self, counters):
+        if self.stats_file is None:
+            return
+        summary = self.summary(counters)
+        self.__replace(self.stats_file, ''.join(f'{key:<20}: {value}\n' for key, value in summary.items()))
+        self.__write_plot(summary)
+        if self.prom_file is not None:
+            self.__write_prometheus(summary)
+        self.last_write = time.time()
+
+    def maybe_write(self, counters):
+        if time.time() - self.last_write >= STATS_INTERVAL:
+            self.write(counters)
@@ -1,120 +1,261 @@
+import importlib
+import logging
 import re
+import time
 from collections import defaultdict
 
 import numpy as np
-import pwalk
-import z3
 
 import fuzz.config as config
-from fuzz.common import init_dir
-from fuzz.sampler import do_sample, chebyshev_center
+from fuzz.cache import LRUCache, content_hash
+from fuzz.sampler import box_bounds, chebyshev_center, do_sample, sample_box
+from fuzz.stats import Telemetry
+
+REG_CRACK_START = re.compile(r'^\[STAT] CRACK:(?P<src>\d+),(?P<dest>\d+)$')
+REG_CRACK_EXPRESS = re.compile(r'^\s*\(.*$')
+CRACK_END = 'CRACK-END'
+# samplers backed by the pwalk extension
+PWALK_SAMPLERS = ('vaidya', 'john')
+
+
+class CrackRecord:
+    __slots__ = ['status', 'offsets', 'lower', 'upper', 'values']
+
+    def __init__(self):
+        """Memoized result of a constraint: solver status, variable bounds and the sampled values
+
+        The status is one of sat, unsat, timeout, unknown (timed out twice) and error.
+        """
+        self.status = 'error'
+        self.offsets = None
+        self.lower = None
+        self.upper = None
+        self.values = None  # uint8 matrix, the first row is the model
+
+
+class CrackLogParser:
+    def __init__(self):
+        """Incremental parser of the crack log, fed line by line"""
+        self.src_bb = 0
+        self.record_flag = False
+        self.express_list = list()
+
+    def feed(self, line):
+        """Return (src_bb, constraint) once the line completes a CRACK block"""
+        if isinstance(line, bytes):
+            try:
+                line = line.decode()
+            except UnicodeDecodeError:
+                return None
+        line = line.rstrip('\r\n')
+        start_matcher = REG_CRACK_START.match(line)
+        if start_matcher is not None:
+            self.src_bb = int(start_matcher.groupdict()['src'])
+            self.record_flag = True
+            return None
+        if not self.record_flag:
+            return None
+        if REG_CRACK_EXPRESS.match(line) is not None:
+            self.express_list.append(line)
+            return None
+        if line == CRACK_END:
+            constraint = '\n'.join(self.express_list)
+            self.express_list.clear()
+            self.record_flag = False
+            return self.src_bb, constraint
+        return None
 
 
 class Synchronizer:
-    def __init__(self, sample_out, sampler):
+    def __init__(self, sampler, telemetry=None, logger=None):
         self.sampler = sampler
-        self.sample_out = sample_out
-        self.sample_id = 0
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.telemetry = telemetry if telemetry is not None else Telemetry()
+        # kept across the cycles
+        self.memo = LRUCache(config.CONSTRAINT_MEMO_SIZE)
+        self.memo_hits = 0
+        self.memo_miss = 0
         self.reg_index = re.compile(r'^k!(?P<idx>\d+)0$')
-        self.reg_start = re.compile(r'^\[STAT] CRACK:(?P<src>\d+),(?P<dest>\d+)$')
-        self.reg_express = re.compile(r'^\s*\(.*$')
-        self.str_end = 'CRACK-END'
 
-    def __save_seed(self, seed_input, offsets, result):
-        with open(seed_input, 'rb') as seed_fp:
-            arr = bytearray(seed_fp.read())
+    def load_backends(self):
+        """Import z3, it is slow to load so the startup skips it, pwalk is imported by the first walk"""
+        importlib.import_module('z3')
+
+    def __load_offsets(self, seed_arr, offsets):
+        """Map the symbolic variables to byte offsets, -1 for the invalid ones"""
+        offset_idx = np.full(len(offsets), -1, dtype=np.int64)
         for idx, k_name in enumerate(offsets):
             matcher = self.reg_index.match(k_name)
             if matcher is None:
                 continue
             offset = int(matcher.groupdict()['idx'])
-            value = result[idx]
-            arr[offset] = value
-        mutant_path = self.sample_out.joinpath(f'id:{self.sample_id}')
-        self.sample_id += 1
-        with open(mutant_path, 'wb') as mutant_fp:
-            mutant_fp.write(bytes(arr))
-
-    def dump_constraint(self, constraint_info):
+            if offset < len(seed_arr):
+                offset_idx[idx] = offset
+        return offset_idx
+
+    @staticmethod
+    def materialize(seed_arr, offset_idx, results):
+        """Apply the value matrix (one row per mutant) to the seed bytes"""
+        results = np.atleast_2d(np.asarray(results, dtype=np.int64))
+        valid_col = offset_idx >= 0
+        results = results[:, valid_col]
+        # the values out of the byte range are unable to be written back
+        results = results[((results >= 0) & (results <= 255)).all(axis=1)]
+        mutants = np.tile(seed_arr, (len(results), 1))
+        mutants[:, offset_idx[valid_col]] = results
+        return mutants
+
+    @staticmethod
+    def dump_constraint(constraint_info):
         """Parse the constraint log"""
         constraint_dict = defaultdict(list)
-        src_bb = 0
-        record_flag = False
-        express_list = list()
+        parser = CrackLogParser()
         for line in constraint_info.splitlines():
-            try:
-                line = line.decode()
-            except UnicodeDecodeError:
-                continue
-            start_matcher = self.reg_start.match(line)
-            if start_matcher is not None:
-                src_bb = int(start_matcher.groupdict()['src'])
-                record_flag = True
-                continue
-            express_matcher = self.reg_express.match(line)
-            if record_flag and express_matcher is not None:
-                express_list.append(line)
-                continue
-            if line == self.str_end and record_flag:
-                constraint_dict[src_bb].append('\n'.join(express_list))
-                express_list.clear()
-                record_flag = False
-                continue
+            block = parser.feed(line)
+            if block is not None:
+                constraint_dict[block[0]].append(block[1])
         return constraint_dict
 
     def __do_sample(self, leq, leq_rhs, count):
+        if self.sampler == 'box':
+            # the crack polytope is axis-aligned, draw the integer points directly
+            bounds = box_bounds(leq, leq_rhs)
+            if bounds is not None:
+                return sample_box(bounds[0], bounds[1], count)
+            return do_sample(leq, leq_rhs, count=count)
+        if self.sampler in ('hit-and-run', 'dikin'):
+            return do_sample(leq, leq_rhs, count=count, sampler=self.sampler)
+        if self.sampler not in PWALK_SAMPLERS:
+            raise Exception(f'Invalid sampler: {self.sampler}')
+        try:
+            import pwalk
+        except ImportError as e:
+            self.logger.warning(f'{e}, sampling with hit-and-run instead of {self.sampler}')
+            self.sampler = 'hit-and-run'
+            return do_sample(leq, leq_rhs, count=count)
         r = 0.5
         initialization = chebyshev_center(leq, leq_rhs)
-        if self.sampler == 'dikin':
-            res = pwalk.generateDikinWalkSamples(initialization, leq, leq_rhs, r, count)
-        elif self.sampler == 'vaidya':
-            res = pwalk.generateVaidyaWalkSamples(initialization, leq, leq_rhs, r, count)
-        elif self.sampler == 'john':
-            res = pwalk.generateJohnWalkSamples(initialization, leq, leq_rhs, r, count)
-        elif self.sampler == 'hit-and-run':
-            res = do_sample(leq, leq_rhs, count=count)
-        else:
-            raise Exception(f'Invalid sampler: {self.sampler}')
-        return res
+        if self.sampler == 'vaidya':
+            return pwalk.generateVaidyaWalkSamples(initialization, leq, leq_rhs, r, count)
+        return pwalk.generateJohnWalkSamples(initialization, leq, leq_rhs, r, count)
 
-    def crack_target(self, seed_input, constraint):
-        """Sample-based algorithm"""
-        sample_out = init_dir(self.sample_out)
-        solver = z3.Solver()
-        solver.set('timeout', config.SOLVER_TIMEOUT)
+    @staticmethod
+    def __remain_ms(deadline):
+        return int(min(config.SOLVER_TIMEOUT, (deadline - time.time()) * 1000))
+
+    def __box_bounds(self, assertions, variables, model_value, deadline):
+        """Bound all the variables with a single box-priority optimization"""
+        lower = model_value.copy()
+        upper = model_value.copy()
+        timeout = self.__remain_ms(deadline)
+        if timeout <= 0:
+            return lower, upper
+        import z3
+        opt = z3.Optimize()
+        opt.set('timeout', timeout)
+        opt.set('priority', 'box')
+        opt.add(assertions)
+        objectives = [(opt.maximize(bv), opt.minimize(bv)) for bv in variables]
+        if opt.check() != z3.sat:
+            # the optimizer timed out, fall back to the model value
+            return lower, upper
+        for idx, (obj_max, obj_min) in enumerate(objectives):
+            upper[idx] = obj_max.value().as_long()
+            lower[idx] = obj_min.value().as_long()
+        return lower, upper
+
+    @staticmethod
+    def box_polytope(lower, upper):
+        """Polytope of the box: x <= upper, -x <= -lower"""
+        var_num = len(lower)
+        leq = np.zeros((2 * var_num, var_num))
+        leq_rhs = np.zeros(2 * var_num)
+        for idx in range(var_num):
+            leq[2 * idx][idx] = 1
+            leq[2 * idx + 1][idx] = -1
+            leq_rhs[2 * idx] = upper[idx]
+            leq_rhs[2 * idx + 1] = -lower[idx]
+        return leq, leq_rhs
+
+    def __solve_constraint(self, constraint):
+        """Solve, bound and sample the constraint, independent of the seed bytes"""
+        record = CrackRecord()
+        deadline = time.time() + config.CRACK_TIME_BUDGET / 1000
+        value_list = list()
+        start = time.perf_counter()
+        sample_start = None
+        import z3
         try:
-            solver.from_string(constraint)
-            solver.check()
+            assertions = z3.parse_smt2_string(constraint)
+            solver = z3.Solver()
+            solver.set('timeout', self.__remain_ms(deadline))
+            solver.add(assertions)
+            check_res = solver.check()
+            if check_res != z3.sat:
+                record.status = 'unsat' if check_res == z3.unsat else 'timeout'
+                return record
             crack_m = solver.model()
+            decls = crack_m.decls()
             # Invalid path constraint
-            if len(crack_m.decls()) == 0:
-                return
-            offsets = [d.name() for d in crack_m.decls()]
-            result = [int(crack_m[d].__str__()) for d in crack_m.decls()]
-            self.__save_seed(seed_input, offsets, result)
+            if len(decls) == 0:
+                record.status = 'unsat'
+                return record
+            record.status = 'sat'
+            record.offsets = [d.name() for d in decls]
+            result = np.array([crack_m[d].as_long() for d in decls], dtype=np.int64)
+            value_list.append(result[np.newaxis, :])
             # Polyhedral Path Abstraction
-            opt = z3.Optimize()
-            opt.set('timeout', config.SOLVER_TIMEOUT)
-            opt.set('priority', 'box')
-            var_num = len(offsets)
-            leq = np.zeros((2 * var_num, var_num))
-            leq_rhs = np.zeros(2 * var_num)
-            for idx, k_name in enumerate(offsets):
-                leq[2 * idx][idx] = 1
-                leq[2 * idx + 1][idx] = -1
-                bv = z3.BitVec(k_name, config.BIT_VER_WIDTH)
-                obj_max = opt.maximize(bv)
-                obj_min = opt.minimize(bv)
-                opt.check()
-                leq_rhs[2 * idx] = int(str(obj_max.value()))
-                leq_rhs[2 * idx + 1] = int(str(obj_min.value()))
+            record.lower, record.upper = self.__box_bounds(assertions, [d() for d in decls], result, deadline)
+            # the fixed variables keep the model value
+            free_var = record.lower < record.upper
+            if not free_var.any():
+                return record
+            leq, leq_rhs = self.box_polytope(record.lower[free_var], record.upper[free_var])
             # Sample algorithm
-            results = self.__do_sample(leq, leq_rhs, count=config.DEFAULT_SAMPLER_NUM)
-            for res in results:
-                res = list(res.astype(int))
-                self.__save_seed(seed_input, offsets, res)
+            sample_start = time.perf_counter()
+            samples = self.__do_sample(leq, leq_rhs, count=config.DEFAULT_SAMPLER_NUM)
+            results = np.tile(result, (len(samples), 1))
+            results[:, free_var] = np.asarray(samples).astype(int)
+            value_list.append(results)
         except Exception as e:
             print(f'[Solver] {e}')
         finally:
-            testcases = [seed for seed in sample_out.iterdir()]
-            return testcases
+            if sample_start is None:
+                self.telemetry.record('z3', time.perf_counter() - start)
+            else:
+                self.telemetry.record('z3', sample_start - start)
+                self.telemetry.record('sample', time.perf_counter() - sample_start, len(value_list[-1]))
+            if len(value_list) > 0:
+                values = np.vstack(value_list)
+                # only the byte values can be written back
+                record.values = values[((values >= 0) & (values <= 255)).all(axis=1)].astype(np.uint8)
+            return record
+
+    def crack_target(self, seed_input, constraint):
+        """Sample-based algorithm, return the mutants as a uint8 matrix (one row per mutant)"""
+        seed_arr = np.fromfile(seed_input, dtype=np.uint8)
+        key = content_hash(' '.join(constraint.split()).encode())
+        record = self.memo.get(key)
+        if record is None or record.status == 'timeout':
+            # the solver may finish on a less loaded machine, a timeout is retried once before it sticks
+            retried = record is not None
+            self.memo_miss += 1
+            record = self.__solve_constraint(constraint)
+            if retried and record.status == 'timeout':
+                record.status = 'unknown'
+            self.memo.put(key, record)
+        else:
+            self.memo_hits += 1
+        if record.values is None:
+            return np.empty((0, len(seed_arr)), dtype=np.uint8)
+        offset_idx = self.__load_offsets(seed_arr, record.offsets)
+        return self.materialize(seed_arr, offset_idx, record.values)
+
+    @property
+    def memo_hit_rate(self):
+        lookups = self.memo_hits + self.memo_miss
+        return self.memo_hits / lookups if lookups > 0 else 0.0
+
+    def memo_stats(self):
+        return f'{self.memo_hits} hits ({self.memo_hit_rate:.1%}), {self.memo_miss} misses, ' \
+               f'{len(self.memo)} constraints'
@@ -1,47 +1,181 @@
+import multiprocessing
+import os
 import re
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from shlex import split
-from tqdm import tqdm
+
+import numpy as np
 
 from fuzz.condition import CondStmt
+from fuzz.config import TRACE_CHUNK_RECORDS
+
+REG_TRACE = re.compile(r'^\[\*]\s\((?P<condition>.*)\): (?P<src>\d+),(?P<dest>\d+).*$')
+
+# record layout shared with trace-rt.o.c
+TRACE_DTYPE = np.dtype([('src', '<u4'), ('dest', '<u4'), ('cond', '<u4'), ('depth', '<u4')])
+TRACE_COND_DEF = 0xFFFFFFFF
+
+
+def dump_trace(trace_info):
+    """Handle the execution path of a seed, return the partial tree {src: [condition, children, min_dist]}"""
+    shard = dict()
+    line_cnt = 0
+    for line in trace_info.splitlines():
+        try:
+            line = line.decode()
+        except UnicodeDecodeError:
+            continue
+        line_cnt += 1
+        matcher = REG_TRACE.match(line)
+        if matcher is None:
+            continue
+        # match the trace information
+        src_bb = int(matcher.groupdict()['src'])
+        dest_bb = int(matcher.groupdict()['dest'])
+        if src_bb not in shard:
+            shard[src_bb] = [matcher.groupdict()['condition'], set(), line_cnt]
+        shard[src_bb][1].add(dest_bb)
+    return shard
+
+
+def merge_records(shard, records, cond_table):
+    """Merge a chunk of binary trace records into the partial tree"""
+    if len(records) == 0:
+        return
+    edge_key = records['src'].astype(np.uint64) << np.uint64(32) | records['dest']
+    _, first_idx = np.unique(edge_key, return_index=True)
+    # visit the distinct edges in trace order, the first record of a source has its min distance
+    for idx in np.sort(first_idx):
+        src_bb, dest_bb, cond_id, depth = records[idx].tolist()
+        if src_bb not in shard:
+            shard[src_bb] = [cond_table[cond_id], set(), depth]
+        shard[src_bb][1].add(dest_bb)
+
+
+def dump_binary_trace(stream, chunk_records=TRACE_CHUNK_RECORDS):
+    """Decode the binary trace incrementally, return the same partial tree as dump_trace
+
+    The trace is partial when it ends inside a record, the records before it are kept.
+    """
+    shard = dict()
+    cond_table = dict()
+    rec_size = TRACE_DTYPE.itemsize
+    pending = bytes()
+    while True:
+        data = stream.read(chunk_records * rec_size)
+        if not data:
+            break
+        buf = pending + data
+        pos = 0
+        while True:
+            records = np.frombuffer(buf, dtype=TRACE_DTYPE, count=(len(buf) - pos) // rec_size, offset=pos)
+            cond_defs = np.flatnonzero(records['src'] == TRACE_COND_DEF)
+            if len(cond_defs) == 0:
+                merge_records(shard, records, cond_table)
+                pos += len(records) * rec_size
+                break
+            def_idx = cond_defs[0]
+            merge_records(shard, records[:def_idx], cond_table)
+            pos += int(def_idx) * rec_size
+            str_len = int(records[def_idx]['dest'])
+            # the condition string is padded to the record size
+            str_size = -(-str_len // rec_size) * rec_size
+            if pos + rec_size + str_size > len(buf):
+                # wait for the rest of the condition string
+                break
+            cond_str = buf[pos + rec_size: pos + rec_size + str_len]
+            cond_table[int(records[def_idx]['cond'])] = cond_str.decode(errors='replace')
+            pos += rec_size + str_size
+        pending = buf[pos:]
+    return shard, len(pending) > 0
+
+
+def trace_seed(trace_bin, put_args, seed_path, binary=False):
+    """Run the trace binary on a seed, executed in the worker process
+
+    The trace is partial if the target was killed by a signal or its last record is truncated.
+    """
+    trace_cmd = f"{trace_bin} {put_args.replace('@@', str(seed_path))}"
+    if not binary:
+        p = subprocess.Popen(split(trace_cmd), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        _, trace_info = p.communicate()
+        return seed_path, dump_trace(trace_info), p.returncode < 0
+    read_fd, write_fd = os.pipe()
+    trace_env = dict(os.environ, COFUZZ_TRACE_FD=str(write_fd), COFUZZ_TRACE_DEDUP='1')
+    try:
+        p = subprocess.Popen(split(trace_cmd), env=trace_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                             pass_fds=(write_fd,))
+    finally:
+        os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as stream:
+        shard, truncated = dump_binary_trace(stream)
+    p.wait()
+    return seed_path, shard, truncated or p.returncode < 0
 
 
 class CorpusTracer:
-    def __init__(self, state, trace_bin, put_args):
+    def __init__(self, state, trace_bin, put_args, jobs=1, binary=False):
         self.trace_bin = trace_bin
-        self.reg_trace = re.compile(r'^\[\*]\s\((?P<condition>.*)\): (?P<src>\d+),(?P<dest>\d+).*$')
         # @@ as the placeholder for the seed path
         self.put_args = put_args
         self.state = state
+        self.jobs = jobs
+        self.binary = binary
+        self.partial_traces = 0
+        # the trace workers, started by the first parallel trace and kept for the later ones
+        self.pool = None
+
+    def merge_shard(self, seed_path, shard):
+        """Merge the partial tree of a seed into the execution tree"""
+        with self.state.lock:
+            seed_id = self.state.seed_id(seed_path)
+            covered = list()
+            uncovered = list()
+            for src_bb, (cond_str, children, min_dist) in shard.items():
+                if src_bb not in self.state.cov_state:
+                    self.state.cov_state[src_bb] = CondStmt(src_bb, cond_str, min_dist)
+                # update the statement
+                cond_node = self.state.cov_state[src_bb]
+                cond_node.children.update(children)
+                cond_node.belongs.add(seed_id)
+                cond_node.update_dist(min_dist)
+                (covered if cond_node.is_branch_covered() else uncovered).append(src_bb)
+            self.state.touch(covered)
+            self.state.touch(uncovered, seed_id, covered=False)
+
+    def __trace_shards(self, seeds_list):
+        """Trace the seeds, yield the partial trees in the order of the seeds"""
+        if self.jobs <= 1 or len(seeds_list) <= 1:
+            for seed_path in seeds_list:
+                yield trace_seed(self.trace_bin, self.put_args, seed_path, self.binary)
+            return
+        chunk_size = max(1, len(seeds_list) // (4 * self.jobs))
+        trace_bin = [self.trace_bin] * len(seeds_list)
+        put_args = [self.put_args] * len(seeds_list)
+        binary = [self.binary] * len(seeds_list)
+        if self.pool is None:
+            # forking the threaded process may copy a lock held by another thread, the workers come from a forkserver
+            self.pool = ProcessPoolExecutor(max_workers=self.jobs, mp_context=multiprocessing.get_context('forkserver'))
+        try:
+            yield from self.pool.map(trace_seed, trace_bin, put_args, seeds_list, binary, chunksize=chunk_size)
+        except BrokenProcessPool:
+            # a worker died, the next trace starts a new pool
+            self.close()
+            raise
 
-    def __dump_trace(self, trace_info, seed_path):
-        """Handle the execution path of a seed"""
-        line_cnt = 0
-        for line in trace_info.splitlines():
-            try:
-                line = line.decode()
-            except UnicodeDecodeError:
-                continue
-            line_cnt += 1
-            matcher = self.reg_trace.match(line)
-            if matcher is None:
-                continue
-            # match the trace information
-            cond_str = matcher.groupdict()['condition']
-            src_bb = int(matcher.groupdict()['src'])
-            dest_bb = int(matcher.groupdict()['dest'])
-            if src_bb not in self.state.cov_state:
-                self.state.cov_state[src_bb] = CondStmt(src_bb, cond_str, line_cnt)
-            # update the statement
-            cond_node = self.state.cov_state[src_bb]
-            cond_node.children.add(dest_bb)
-            cond_node.belongs.add(seed_path)
-            cond_node.update_dist(line_cnt)
+    def close(self):
+        """Stop the trace workers"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
 
     def trace_corpus(self, seeds_list):
         """Trace new seeds and update execution tree"""
-        for seed_path in tqdm(seeds_list, total=len(seeds_list), unit='seed', desc='Trace the seed corpus'):
-            trace_cmd = f"{self.trace_bin} {self.put_args.replace('@@', str(seed_path))}"
-            p = subprocess.Popen(split(trace_cmd), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-            _, trace_info = p.communicate()
-            self.__dump_trace(trace_info, seed_path)
+        from tqdm import tqdm
+        shards = self.__trace_shards(seeds_list)
+        for seed_path, shard, partial in tqdm(shards, total=len(seeds_list), unit='seed', desc='Trace the seed corpus'):
+            # a partial trace is still a prefix of the path taken
+            self.partial_traces += partial
+            self.merge_shard(seed_path, shard)
@@ -0,0 +1,237 @@
+import ctypes
+import heapq
+import os
+import select
+import struct
+import time
+
+from fuzz.common import identify_id, seed_key
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class SeedInfo:
+    __slots__ = ['path', 'seed_id', 'size', 'new_cover', 'from_seed', 'traced']
+
+    def __init__(self, path, size):
+        self.path = path
+        self.seed_id = int(identify_id(path.name))
+        self.size = size
+        self.new_cover = path.name.endswith('+cov')
+        self.from_seed = 'orig:' in path.name
+        self.traced = False
+
+    def core(self):
+        """Priority of the seed: new coverage first, then the initial seeds, then the smaller ones"""
+        return self.new_cover, self.from_seed, -self.size, self.path.name
+
+
+class Inotify:
+    def __init__(self, path):
+        """Watch a directory for completed files"""
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        wd = libc.inotify_add_watch(self.fd, str(path).encode(), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed on {path}')
+
+    def read_events(self, timeout=0):
+        """Return the file names of pending events, None if the kernel queue overflowed"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if len(ready) == 0:
+            return list()
+        names = list()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                _, mask, _, name_len = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                overflow = overflow or (mask & IN_Q_OVERFLOW) != 0
+                if name_len > 0:
+                    names.append(data[pos: pos + name_len].rstrip(b'\0').decode(errors='replace'))
+                pos += name_len
+        return None if overflow else names
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+
+class QueueIndex:
+    def __init__(self, queue_dir):
+        """Incremental index of an AFL queue directory"""
+        self.queue_dir = queue_dir
+        self.seeds = dict()
+        self.unsolved_seeds = dict()
+        self.trace_pending = list()
+        self.max_id = -1
+        self.dir_mtime = None
+        self.fresh = list()
+        try:
+            self.inotify = Inotify(queue_dir)
+        except (OSError, AttributeError):
+            # fall back to polling the directory
+            self.inotify = None
+        self.__scan(full=True)
+        self.fresh = list()
+
+    def __add_seed(self, name):
+        if name in self.seeds or not name.startswith('id:'):
+            return
+        path = self.queue_dir.joinpath(name)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return
+        seed = SeedInfo(path, size)
+        self.seeds[name] = seed
+        self.unsolved_seeds[name] = seed
+        self.trace_pending.append(seed)
+        self.fresh.append(seed)
+        self.max_id = max(self.max_id, seed.seed_id)
+
+    def __scan(self, full=False):
+        """List the directory only when it changed, AFL ids only grow so skip the ids already seen"""
+        try:
+            dir_mtime = os.stat(self.queue_dir).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if dir_mtime == self.dir_mtime and not full:
+            return
+        self.dir_mtime = dir_mtime
+        with os.scandir(self.queue_dir) as entries:
+            for entry in entries:
+                if not entry.name.startswith('id:'):
+                    continue
+                if not full and int(identify_id(entry.name)) <= self.max_id:
+                    continue
+                self.__add_seed(entry.name)
+
+    def refresh(self, timeout=0):
+        """Index the new seeds, return them in id order"""
+        if self.inotify is not None:
+            names = self.inotify.read_events(timeout)
+            if names is None:
+                self.__scan(full=True)
+            else:
+                for name in names:
+                    self.__add_seed(name)
+        else:
+            self.__scan()
+        fresh = sorted(self.fresh, key=lambda x: x.seed_id)
+        self.fresh = list()
+        return fresh
+
+    def wait(self, timeout):
+        """Block until new seeds may have arrived or timeout, the next refresh indexes them"""
+        if self.inotify is None:
+            time.sleep(timeout)
+        else:
+            select.select([self.inotify], [], [], timeout)
+
+    def untraced(self):
+        """Pop the seeds waiting for tracing"""
+        trace_list = sorted([seed for seed in self.trace_pending if not seed.traced], key=lambda x: x.seed_id)
+        self.trace_pending = list()
+        for seed in trace_list:
+            seed.traced = True
+        return trace_list
+
+    def unsolved(self, count):
+        """The top unsolved seeds by SeedInfo.core order"""
+        return heapq.nlargest(count, self.unsolved_seeds.values(), key=SeedInfo.core)
+
+    def mark_solved(self, name):
+        self.unsolved_seeds.pop(name, None)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+class CorpusIndex:
+    def __init__(self, sync_dir):
+        """Index the queues of all the AFL instances in the sync directory"""
+        self.sync_dir = sync_dir
+        self.queues = dict()  # fuzzer name -> QueueIndex
+        self.pending = set()  # dirs without fuzzer_stats yet, AFL writes it inside the dir after creating it
+        self.dir_mtime = None
+        self.__discover()
+
+    def __try_add(self, name):
+        fuzzer_dir = self.sync_dir.joinpath(name)
+        if fuzzer_dir.joinpath('fuzzer_stats').exists() and fuzzer_dir.joinpath('queue').is_dir():
+            self.queues[name] = QueueIndex(fuzzer_dir.joinpath('queue'))
+            self.pending.discard(name)
+        elif fuzzer_dir.is_dir():
+            self.pending.add(name)
+        else:
+            self.pending.discard(name)
+
+    def __discover(self):
+        """Pick up the fuzzers started later, AFL instances are the dirs with fuzzer_stats"""
+        for name in list(self.pending):
+            self.__try_add(name)
+        dir_mtime = os.stat(self.sync_dir).st_mtime_ns
+        if dir_mtime == self.dir_mtime:
+            return
+        self.dir_mtime = dir_mtime
+        with os.scandir(self.sync_dir) as entries:
+            for entry in entries:
+                if entry.name in self.queues or entry.name.startswith('.') or not entry.is_dir():
+                    continue
+                self.__try_add(entry.name)
+
+    def fuzzer_dirs(self):
+        return [queue_index.queue_dir.parent for queue_index in self.queues.values()]
+
+    def refresh(self, timeout=0):
+        self.__discover()
+        fresh = list()
+        for queue_index in list(self.queues.values()):
+            fresh.extend(queue_index.refresh(timeout))
+        return fresh
+
+    def wait(self, timeout):
+        """Block until a queue may have new seeds or timeout, the instances started meanwhile are found by refresh"""
+        watches = [queue_index.inotify for queue_index in self.queues.values()]
+        if len(watches) == 0 or None in watches:
+            # a polled queue is only checked by the next refresh
+            time.sleep(timeout)
+        else:
+            select.select(watches, [], [], timeout)
+
+    def untraced(self):
+        trace_list = list()
+        for queue_index in self.queues.values():
+            trace_list.extend(queue_index.untraced())
+        return trace_list
+
+    def unsolved(self, count):
+        seeds = [queue_index.unsolved(count) for queue_index in self.queues.values()]
+        return heapq.nlargest(count, [seed for seed_list in seeds for seed in seed_list], key=SeedInfo.core)
+
+    def mark_solved(self, key):
+        fuzzer, _, name = key.partition('/')
+        if fuzzer in self.queues:
+            self.queues[fuzzer].mark_solved(name)
+
+    def close(self):
+        for queue_index in self.queues.values():
+            queue_index.close()
@@ -0,0 +1,47 @@
+import numpy as np
+
+from fuzz.afl import AFLMap, classify_counts
+
+
+def test_classify_counts_buckets():
+    counts = np.array([0, 1, 2, 3, 4, 7, 8, 15, 16, 31, 32, 127, 128, 255], dtype=np.uint8)
+    assert classify_counts(counts).tolist() == [0, 1, 2, 4, 8, 8, 16, 16, 32, 32, 64, 64, 128, 128]
+
+
+def test_is_interesting_counts_new_buckets():
+    afl_map = AFLMap(map_size=8)
+    assert afl_map.is_interesting(bytes([1, 0, 0, 0, 0, 0, 0, 0])) == 1
+    assert afl_map.is_interesting(bytes([1, 0, 0, 0, 0, 0, 0, 0])) == 0
+    # a new hit-count bucket of a seen edge counts
+    assert afl_map.is_interesting(bytes([2, 0, 0, 0, 0, 0, 0, 0]), classified=False) == 1
+
+
+def test_batch_interesting_matches_sequential_checks():
+    rng = np.random.default_rng(7)
+    trace_matrix = classify_counts(rng.integers(0, 4, (32, 64), dtype=np.uint8) * (rng.random((32, 64)) < 0.1))
+    sequential = AFLMap(map_size=64)
+    expected = [sequential.is_interesting(row.tobytes()) for row in trace_matrix]
+    batched = AFLMap(map_size=64)
+    assert batched.batch_interesting(trace_matrix).tolist() == expected
+    assert np.array_equal(batched.bitmap, sequential.bitmap)
+
+
+def test_batch_interesting_duplicates_count_once():
+    afl_map = AFLMap(map_size=4)
+    trace_matrix = np.array([[1, 0, 0, 0], [1, 0, 0, 0], [1, 1, 0, 0]], dtype=np.uint8)
+    assert afl_map.batch_interesting(trace_matrix).tolist() == [1, 0, 1]
+    assert afl_map.batch_interesting(trace_matrix).tolist() == [0, 0, 0]
+
+
+def test_update_bitmap_skips_partial_maps(tmp_path):
+    bitmap_file = tmp_path.joinpath('fuzz_bitmap')
+    bitmap_file.write_bytes(b'')
+    afl_map = AFLMap(bitmap_file, map_size=4)
+    assert afl_map.bitmap.tolist() == [0, 0, 0, 0]
+    bitmap_file.write_bytes(bytes([0xfe, 0xff]))
+    afl_map.update_bitmap()
+    assert afl_map.bitmap.tolist() == [0, 0, 0, 0]
+    # the complete map is merged once AFL has finished writing it
+    bitmap_file.write_bytes(bytes([0xfe, 0xff, 0xff, 0x7f]))
+    afl_map.update_bitmap()
+    assert afl_map.bitmap.tolist() == [1, 0, 0, 0x80]
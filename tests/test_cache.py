@@ -0,0 +1,24 @@
+from fuzz.cache import ExecCache, LRUCache, content_hash
+
+
+def test_lru_cache_evicts_the_oldest():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert len(cache) == 2
+
+
+def test_exec_cache_counts_duplicates():
+    cache = ExecCache(max_size=4)
+    key = content_hash(b'testcase')
+    assert cache.lookup(key) is None
+    cache.insert(key, 0, b'digest')
+    assert cache.lookup(key) == (0, b'digest')
+    assert (cache.input_hits, cache.input_miss, cache.input_hit_rate) == (1, 1, 0.5)
+    digest, known = cache.known_coverage(bytes(8))
+    assert not known
+    assert cache.known_coverage(bytes(8)) == (digest, True)
+    assert cache.cov_hit_rate == 0.5
@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import pytest
+
+from fuzz.checkpoint import CheckpointError, load_checkpoint, save_checkpoint
+from fuzz.depot import StateDepot
+from fuzz.scheduler import ModeScheduler
+from fuzz.trace import CorpusTracer
+
+SEEDS = [Path('/sync/afl/queue/id:000000,orig:a'), Path('/sync/afl/queue/id:000001,src:000000,op:havoc')]
+
+
+def build_depot():
+    depot = StateDepot()
+    tracer = CorpusTracer(depot, None, '@@')
+    tracer.merge_shard(SEEDS[0], {1: ['Br_true_icmp_i32', {2}, 1], 2: ['Switch_i8_3', {4}, 2]})
+    tracer.merge_shard(SEEDS[1], {1: ['Br_false_icmp_i32', {3}, 1], 5: ['Br_true_strcmp', {6}, 3]})
+    depot.traced_seeds.update(SEEDS)
+    depot.solved_seeds.add('afl/id:000000,orig:a')
+    depot.mark_cracked(5, 'afl/id:000001,src:000000,op:havoc')
+    return depot
+
+
+def test_round_trip(tmp_path):
+    depot = build_depot()
+    scheduler = ModeScheduler()
+    scheduler.update('crack', 3, 1, 2.0, 4.0, 1)
+    path = tmp_path.joinpath('checkpoint')
+    save_checkpoint(path, {'depot': depot.snapshot(), 'scheduler': scheduler.snapshot(), 'interesting_cnt': 7})
+    payload = load_checkpoint(path)
+    restored = StateDepot()
+    restored.restore(payload['depot'])
+    assert payload['interesting_cnt'] == 7
+    assert restored.seed_table == depot.seed_table
+    assert {addr: (node.cond_str, node.children, node.belongs, node.min_dist)
+            for addr, node in restored.cov_state.items()} == \
+           {addr: (node.cond_str, node.children, node.belongs, node.min_dist) for addr, node in depot.cov_state.items()}
+    assert restored.solved_seeds == depot.solved_seeds
+    assert restored.cracked_seed == depot.cracked_seed
+    # the covered branch left the frontier, the cracked pair is not offered again
+    assert restored.concolic_candidate() == depot.concolic_candidate() == {SEEDS[0]: [2]}
+    restored_scheduler = ModeScheduler()
+    restored_scheduler.restore(payload['scheduler'])
+    assert restored_scheduler.plan(1) == scheduler.plan(1)
+    assert not any(entry.name.endswith('.tmp') for entry in tmp_path.iterdir())
+
+
+def test_corrupted_checkpoint(tmp_path):
+    path = tmp_path.joinpath('checkpoint')
+    save_checkpoint(path, {'depot': build_depot().snapshot()})
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xff
+    path.write_bytes(bytes(data))
+    with pytest.raises(CheckpointError, match='Corrupted'):
+        load_checkpoint(path)
+    path.write_bytes(bytes(data[:4]))
+    with pytest.raises(CheckpointError, match='Truncated'):
+        load_checkpoint(path)
+
+
+def test_model_round_trip(tmp_path):
+    depot = StateDepot()
+    tracer = CorpusTracer(depot, None, '@@')
+    for idx in range(20):
+        shard = {3 * idx + 1: ['Br_true_icmp_i32', {3 * idx + 2}, idx + 1]}
+        tracer.merge_shard(Path(f'/sync/afl/queue/id:{idx:06d}'), shard)
+    depot.update_model({1: 3, 4: 0, 7: 1})
+    path = tmp_path.joinpath('checkpoint')
+    save_checkpoint(path, {'depot': depot.snapshot()})
+    restored = StateDepot()
+    restored.restore(load_checkpoint(path)['depot'])
+    # the weights are restored, the estimator is only built by the next update
+    assert restored.reg is None
+    assert restored.concolic_candidate(edge_max=5) == depot.concolic_candidate(edge_max=5)
+    restored.update_model({10: 2})
+    assert restored.reg.t_ > depot.reg.t_
@@ -0,0 +1,70 @@
+import sys
+import time
+from pathlib import Path
+
+from fuzz.config import SOLVE_YIELD_WINDOW
+from fuzz.conolic import ConcolicExecutor, SolveJob
+
+# prints more crack blocks than the pipe holds, then leaves a marker
+SYMCC = '''#!{python}
+import sys
+from pathlib import Path
+for src_bb in range(200):
+    sys.stderr.write(f'[STAT] CRACK:{{src_bb}},{{src_bb + 1}}\\n')
+    sys.stderr.write('(assert (bvuge k!00 #x{{:02x}}))\\n'.format(src_bb % 128) * 16)
+    sys.stderr.write('CRACK-END\\n')
+sys.stderr.flush()
+Path(sys.argv[1]).with_name('done').touch()
+'''
+
+
+def test_crack_drains_stderr_ahead_of_the_consumer(tmp_path):
+    symcc = tmp_path.joinpath('symcc')
+    symcc.write_text(SYMCC.format(python=sys.executable))
+    symcc.chmod(0o755)
+    seed = tmp_path.joinpath('seed')
+    seed.write_bytes(b'seed')
+    executor = ConcolicExecutor(tmp_path, tmp_path.joinpath('out'), symcc, '@@')
+    blocks = executor.crack(seed, [1], timeout=10)
+    assert next(blocks)[0] == 0
+    # SymCC finishes while the consumer holds the first block
+    deadline = time.time() + 5
+    while not tmp_path.joinpath('done').exists() and time.time() < deadline:
+        time.sleep(0.05)
+    assert tmp_path.joinpath('done').exists()
+    assert [src_bb for src_bb, _ in blocks] == list(range(1, 200))
+
+
+def test_solve_job_stops_on_low_yield():
+    job = SolveJob(Path('seed'), min_yield=0.5)
+    for _ in range(SOLVE_YIELD_WINDOW - 1):
+        job.record(0)
+    # a partial window is not judged
+    assert not job.exhausted()
+    job.record(0)
+    assert job.exhausted()
+    for _ in range(SOLVE_YIELD_WINDOW // 2):
+        job.record(3)
+    assert not job.exhausted()
+    assert job.new_cov == SOLVE_YIELD_WINDOW // 2
+    never = SolveJob(Path('seed'), min_yield=0)
+    for _ in range(SOLVE_YIELD_WINDOW):
+        never.record(0)
+    assert not never.exhausted()
+
+
+def test_solve_hands_over_each_testcase(tmp_path):
+    symcc = tmp_path.joinpath('symcc')
+    symcc.write_text(f'#!{sys.executable}\n'
+                     'import os\n'
+                     'for idx in range(3):\n'
+                     "    with open(os.path.join(os.environ['SYMCC_OUTPUT_DIR'], f'{idx:06d}'), 'wb') as fp:\n"
+                     "        fp.write(b'out%d' % idx)\n")
+    symcc.chmod(0o755)
+    seed = tmp_path.joinpath('seed')
+    seed.write_bytes(b'seed')
+    executor = ConcolicExecutor(tmp_path, tmp_path.joinpath('out'), symcc, '@@')
+    testcases = list()
+    assert executor.solve(seed, testcases.append, timeout=10) == (3, False, False)
+    assert testcases == [b'out0', b'out1', b'out2']
+    assert list(tmp_path.joinpath('out').iterdir()) == []
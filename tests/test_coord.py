@@ -0,0 +1,57 @@
+import os
+import time
+from pathlib import Path
+
+from fuzz.config import CLAIM_TTL
+from fuzz.coord import Coordinator
+
+
+def test_claim_is_exclusive(tmp_path):
+    first = Coordinator(tmp_path, 'first')
+    second = Coordinator(tmp_path, 'second')
+    assert first.claim('solve', 'afl/id:000000')
+    assert first.claim('solve', 'afl/id:000000')
+    assert not second.claim('solve', 'afl/id:000000')
+    assert second.conflicts == 1
+    first.close()
+    second.close()
+
+
+def test_stale_claim_expires(tmp_path):
+    first = Coordinator(tmp_path, 'first')
+    second = Coordinator(tmp_path, 'second')
+    assert first.claim('solve', 'afl/id:000000')
+    past = time.time() - CLAIM_TTL - 1
+    for path in first.claim_dir.iterdir():
+        os.utime(path, (past, past))
+    assert second.claim('solve', 'afl/id:000000')
+    assert not first.claim('solve', 'afl/id:000000')
+    first.close()
+    second.close()
+
+
+def test_record_drops_the_claim(tmp_path):
+    coordinator = Coordinator(tmp_path, 'first')
+    assert coordinator.claim('solve', 'afl/id:000000')
+    coordinator.record('solve', 'afl/id:000000')
+    claimed = coordinator.claim_cracks({Path('afl/queue/id:000001'): [5, 6]})
+    assert claimed == {Path('afl/queue/id:000001'): [5, 6]}
+    assert list(coordinator.claim_dir.iterdir()) == []
+    assert coordinator.ledger_dir.joinpath('first').read_text().splitlines() == [
+        'solve\tafl/id:000000', 'crack\t5\tafl/id:000001', 'crack\t6\tafl/id:000001']
+    coordinator.close()
+
+
+def test_recorded_work_stays_taken(tmp_path):
+    first = Coordinator(tmp_path, 'first')
+    second = Coordinator(tmp_path, 'second')
+    seed_path = Path('afl/queue/id:000001')
+    assert first.claim_cracks({seed_path: [5]}) == {seed_path: [5]}
+    assert first.claim('solve', 'afl/id:000000')
+    first.record('solve', 'afl/id:000000')
+    # the claims are gone, the second instance has not synced yet
+    assert second.claim_cracks({seed_path: [5, 6]}) == {seed_path: [6]}
+    assert not second.claim('solve', 'afl/id:000000')
+    assert list(second.claim_dir.iterdir()) == []
+    first.close()
+    second.close()
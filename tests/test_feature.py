@@ -0,0 +1,25 @@
+import numpy as np
+
+from fuzz.condition import CondStmt
+from fuzz.feature import FeatureMatrix
+
+
+def test_rows_grow_and_sync_the_touched_nodes():
+    cov_state = {addr: CondStmt(addr, 'Br_true_icmp_i32', 1 << addr) for addr in range(1, 4)}
+    matrix = FeatureMatrix(capacity=2)
+    matrix.touch(cov_state.keys())
+    matrix.sync(cov_state)
+    assert matrix.size == 3 and len(matrix.addrs) == 4
+    assert matrix.row_of([3, 1]).tolist() == [2, 0]
+    assert matrix.features[matrix.row(2)].tolist() == cov_state[2].edge_feature().tolist()
+    # only the touched node is refreshed
+    cov_state[2].children.add(9)
+    cov_state[3].children.add(9)
+    matrix.touch([2])
+    matrix.sync(cov_state)
+    assert matrix.features[matrix.row(2)].tolist() == cov_state[2].edge_feature().tolist()
+    assert matrix.features[matrix.row(3)].tolist() != cov_state[3].edge_feature().tolist()
+    matrix.add_crack(3, 2)
+    assert matrix.cracked[:matrix.size].tolist() == [0, 0, 2]
+    blk_hit = np.arange(8) * 10
+    assert matrix.matrix(matrix.row_of([1, 3]), blk_hit)[:, -1].tolist() == [10, 30]
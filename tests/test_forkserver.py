@@ -0,0 +1,43 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from fuzz.forkserver import ForkServer
+
+# speaks the AFL forkserver protocol, the input picks how the child ends
+TARGET = '''
+import os, signal, struct, sys, time
+os.write(199, struct.pack('I', 0))
+while len(os.read(198, 4)) == 4:
+    pid = os.fork()
+    if pid == 0:
+        data = open(sys.argv[1], 'rb').read()
+        if data == b'crash':
+            os.kill(os.getpid(), signal.SIGSEGV)
+        if data == b'hang':
+            time.sleep(10)
+        os._exit(86 if data == b'asan' else 0)
+    os.write(199, struct.pack('I', pid))
+    os.write(199, struct.pack('I', os.waitpid(pid, 0)[1]))
+'''
+
+
+def test_status_mapping(tmp_path):
+    script = tmp_path.joinpath('target.py')
+    script.write_text(TARGET)
+    forkserver = ForkServer(f'{sys.executable} {script} @@', tmp_path.joinpath('input'), timeout=500)
+    # a validator thread restarts the forkserver, the spawn must not run Python code in the child
+    starter = threading.Thread(target=forkserver.start)
+    starter.start()
+    starter.join()
+    try:
+        assert [forkserver.run(data)[1] for data in (b'ok', b'crash', b'asan', b'hang', b'ok')] == [0, 2, 2, 1, 0]
+    finally:
+        pid = forkserver.pid
+        forkserver.close()
+    assert forkserver.pid is None
+    # the session of the target is gone
+    with pytest.raises(ProcessLookupError):
+        os.killpg(pid, 0)
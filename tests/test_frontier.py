@@ -0,0 +1,41 @@
+from fuzz.frontier import FrontierIndex
+
+
+def never(seed_id):
+    return False
+
+
+def test_add_and_cover():
+    frontier = FrontierIndex(capacity=2)
+    for row in range(5):
+        frontier.add_seed(row, row)
+    frontier.add_seed(3, 7)
+    assert len(frontier) == 5
+    frontier.cover(1)
+    frontier.cover(1)
+    assert sorted(frontier.edges().tolist()) == [0, 2, 3, 4]
+    assert frontier.take(1, 4, never, never) == []
+
+
+def test_take_unsolved_first():
+    frontier = FrontierIndex()
+    frontier.add_seed(0, 1, solved=True)
+    frontier.add_seed(0, 2)
+    frontier.add_seed(0, 3)
+    assert sorted(frontier.take(0, 2, never, never)) == [2, 3]
+    assert frontier.take(0, 2, never, never) == [1]
+    # the exhausted edge leaves the frontier until a new seed reaches it
+    assert len(frontier) == 0
+    frontier.add_seed(0, 4)
+    assert frontier.edges().tolist() == [0]
+
+
+def test_take_skips_tried_and_moves_solved():
+    frontier = FrontierIndex()
+    for seed_id in range(4):
+        frontier.add_seed(0, seed_id)
+    picked = frontier.take(0, 4, lambda seed_id: seed_id == 1, lambda seed_id: seed_id == 2)
+    # the seed solved since it was added is drawn after the unsolved ones, the tried one is dropped
+    assert sorted(picked[:2]) == [0, 3]
+    assert picked[2:] == [1]
+    assert len(frontier) == 0
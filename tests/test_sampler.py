@@ -0,0 +1,35 @@
+import numpy as np
+
+from fuzz.sampler import box_bounds, dikin_chains, sample_box
+from fuzz.sync import Synchronizer
+
+
+def test_dikin_chains_stay_inside():
+    rng = np.random.default_rng(3)
+    leq = np.vstack((np.eye(4), -np.eye(4), rng.normal(size=(4, 4))))
+    leq_rhs = np.concatenate((np.full(8, 2.0), np.ones(4)))
+    points = dikin_chains(leq, leq_rhs, np.zeros(4), 200, 8, 50, 5, rng=rng)
+    assert points.shape == (200, 4)
+    assert (points.dot(leq.T) < leq_rhs).all()
+    # the chains move away from the start point
+    assert len(np.unique(points, axis=0)) > 100
+
+
+def test_box_bounds_round_trip():
+    lower, upper = np.array([0.0, 3.0, 65.0]), np.array([255.0, 3.0, 90.0])
+    # the lower bounds come from the rows -x <= -min
+    leq, leq_rhs = Synchronizer.box_polytope(lower, upper)
+    bounds = box_bounds(leq, leq_rhs)
+    assert bounds[0].tolist() == lower.tolist() and bounds[1].tolist() == upper.tolist()
+    points = sample_box(*bounds, 50, rng=np.random.default_rng(0))
+    assert (points >= lower).all() and (points <= upper).all() and (points[:, 1] == 3).all()
+
+
+def test_box_bounds_scaled_and_redundant_rows():
+    leq = np.array([[2.0, 0.0], [-2.0, 0.0], [0.0, 1.0], [0.0, 1.0], [0.0, -1.0]])
+    leq_rhs = np.array([6.0, -2.0, 9.0, 7.0, 0.0])
+    lower, upper = box_bounds(leq, leq_rhs)
+    assert lower.tolist() == [1.0, 0.0] and upper.tolist() == [3.0, 7.0]
+    # a row over two variables or an unbounded variable is not a box
+    assert box_bounds(np.array([[1.0, 1.0], [-1.0, 0.0], [0.0, -1.0]]), np.ones(3)) is None
+    assert box_bounds(leq[:4], leq_rhs[:4]) is None
@@ -0,0 +1,52 @@
+import pytest
+
+from fuzz.config import BANDIT_MIN_SHARE, CONCOLIC_TIMEOUT, RAND_SOLVE_NUM, TIMEOUT_MIN_RUNS
+from fuzz.scheduler import MODES, ModeScheduler
+
+
+def test_plan_without_estimates():
+    scheduler = ModeScheduler(budget=100)
+    assert scheduler.plan(2) == {'crack': None, 'solve': None, 'random': RAND_SOLVE_NUM * 2}
+    assert sum(scheduler.shares().values()) == pytest.approx(1.0)
+
+
+def test_plan_follows_the_yield():
+    scheduler = ModeScheduler(budget=100)
+    for _ in range(5):
+        # same cost per seed, crack finds ten times the coverage per CPU-second
+        scheduler.update('crack', 10, 50, 10.0, 10.0, 1)
+        scheduler.update('solve', 10, 5, 10.0, 10.0, 1)
+        scheduler.update('random', 10, 5, 10.0, 10.0, 1)
+    shares = scheduler.shares()
+    assert sum(shares.values()) == pytest.approx(1.0)
+    assert min(shares.values()) >= BANDIT_MIN_SHARE
+    limits = scheduler.plan(1)
+    assert limits['crack'] > limits['solve'] == limits['random'] >= 1
+    # twice the workers run twice the seeds in the same wall time
+    assert scheduler.plan(2)['crack'] == pytest.approx(2 * limits['crack'], abs=1)
+
+
+def test_idle_mode_is_skipped():
+    scheduler = ModeScheduler()
+    scheduler.update('crack', 0, 0, 1.0, 1.0, 1)
+    assert scheduler.modes['crack'].pulls == 0
+
+
+def test_timeout_from_runtimes():
+    scheduler = ModeScheduler()
+    assert scheduler.timeout('solve') == CONCOLIC_TIMEOUT
+    scheduler.observe([('solve', 1.0)] * TIMEOUT_MIN_RUNS)
+    assert scheduler.timeout('solve') < CONCOLIC_TIMEOUT
+    assert scheduler.timeout('crack') == CONCOLIC_TIMEOUT
+
+
+def test_snapshot_round_trip():
+    scheduler = ModeScheduler()
+    scheduler.update('solve', 4, 2, 3.0, 5.0, 2)
+    scheduler.observe([('crack', 2.5)])
+    restored = ModeScheduler()
+    restored.restore(scheduler.snapshot())
+    assert restored.shares() == scheduler.shares()
+    assert restored.plan(2) == scheduler.plan(2)
+    assert list(restored.runtimes['crack']) == [2.5]
+    assert set(restored.modes) == set(MODES)
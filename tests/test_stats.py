@@ -0,0 +1,25 @@
+from fuzz.stats import Telemetry
+
+
+def test_write_stats_plot_and_prometheus(tmp_path):
+    prometheus = tmp_path.joinpath('cofuzz.prom')
+    telemetry = Telemetry(tmp_path, prometheus)
+    with telemetry.stage('validate', 4):
+        pass
+    telemetry.record('validate', 0.5, 4)
+    counters = {'interesting_seeds': 2, 'crash_seeds': 0, 'hang_seeds': 1, 'cache_hit_rate': 0.25,
+                'memo_hit_rate': 0.75}
+    telemetry.write(counters)
+    telemetry.write(counters)
+    stats = dict(line.split(':', 1) for line in tmp_path.joinpath('cofuzz_stats').read_text().splitlines())
+    stats = {key.strip(): value.strip() for key, value in stats.items()}
+    assert stats['execs_done'] == '8'
+    assert stats['validate_count'] == '2'
+    assert stats['cache_hit_rate'] == '0.25'
+    plot = tmp_path.joinpath('plot_data').read_text().splitlines()
+    assert plot[0].startswith('# last_update') and len(plot) == 3
+    metrics = prometheus.read_text().splitlines()
+    assert 'cofuzz_memo_hit_rate 0.75' in metrics
+    assert 'cofuzz_stage_items_total{stage="validate"} 8' in metrics
+    assert 'cofuzz_stage_seconds_count{stage="validate"} 2' in metrics
+    assert not any(entry.name.endswith('.tmp') for entry in tmp_path.iterdir())
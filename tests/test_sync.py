@@ -0,0 +1,64 @@
+import numpy as np
+
+from fuzz.sync import CrackLogParser, CrackRecord, Synchronizer
+
+
+def test_crack_log_parser_skips_the_noise():
+    parser = CrackLogParser()
+    lines = [b'[INFO] Trying to solve\n', b'(assert (= k!00 #x41))\n', b'[STAT] CRACK:12,13\n',
+             b'(declare-fun k!00 () (_ BitVec 8))\n', b'[INFO] noise inside the block\n',
+             b'(assert (bvuge k!00 #x41))\r\n', b'\xff\xfe\n', b'CRACK-END\n', b'(assert (= k!00 #x42))\n']
+    blocks = [block for block in map(parser.feed, lines) if block is not None]
+    assert blocks == [(12, '(declare-fun k!00 () (_ BitVec 8))\n(assert (bvuge k!00 #x41))')]
+
+
+def test_materialize_writes_the_valid_offsets():
+    seed_arr = np.frombuffer(b'abcd', dtype=np.uint8)
+    offset_idx = np.array([1, -1, 3])
+    results = [[65, 7, 66], [300, 7, 67], [68, 999, 69]]
+    mutants = Synchronizer.materialize(seed_arr, offset_idx, results)
+    # the invalid offset is ignored, the row with a value out of the byte range is dropped
+    assert [row.tobytes() for row in mutants] == [b'aAcB', b'aDcE']
+    assert Synchronizer.materialize(seed_arr, offset_idx, [65, 0, 66]).tobytes() == b'aAcB'
+
+
+CONSTRAINT = '''(declare-fun k!00 () (_ BitVec 8))
+(declare-fun k!20 () (_ BitVec 8))
+(assert (bvuge k!00 #x41))
+(assert (bvule k!00 #x5a))
+(assert (= k!20 #x2d))'''
+
+
+def test_memo_shared_across_seeds(tmp_path):
+    sampler = Synchronizer('box')
+    first, second = tmp_path.joinpath('first'), tmp_path.joinpath('second')
+    first.write_bytes(b'abcd')
+    second.write_bytes(b'wxyz')
+    mutants = sampler.crack_target(first, CONSTRAINT)
+    assert len(mutants) > 0
+    assert ((mutants[:, 0] >= 0x41) & (mutants[:, 0] <= 0x5a)).all()
+    assert (mutants[:, 1:] == np.frombuffer(b'b-d', dtype=np.uint8)).all()
+    # the same constraint with other spacing is answered by the memo, on the bytes of the second seed
+    mutants = sampler.crack_target(second, '  ' + CONSTRAINT.replace('\n', '\n   '))
+    assert (mutants[:, 1:] == np.frombuffer(b'x-z', dtype=np.uint8)).all()
+    assert (sampler.memo_hits, sampler.memo_miss, sampler.memo_hit_rate) == (1, 1, 0.5)
+
+
+def test_memo_retries_a_timeout_once(tmp_path, monkeypatch):
+    seed = tmp_path.joinpath('seed')
+    seed.write_bytes(b'abcd')
+    sampler = Synchronizer('box')
+    calls = list()
+
+    def timeout(constraint):
+        calls.append(constraint)
+        record = CrackRecord()
+        record.status = 'timeout'
+        return record
+    monkeypatch.setattr(sampler, '_Synchronizer__solve_constraint', timeout)
+    for _ in range(3):
+        assert len(sampler.crack_target(seed, CONSTRAINT)) == 0
+    # solved twice, then the second timeout sticks as unknown
+    assert len(calls) == 2
+    assert (sampler.memo_hits, sampler.memo_miss) == (1, 2)
+    assert next(iter(sampler.memo.items.values())).status == 'unknown'
@@ -0,0 +1,71 @@
+import io
+
+import numpy as np
+
+from fuzz.depot import StateDepot
+from fuzz.trace import TRACE_COND_DEF, TRACE_DTYPE, CorpusTracer, dump_binary_trace, dump_trace
+
+
+def cond_def(cond_id, cond_str):
+    data = cond_str.encode()
+    padded = data.ljust(-(-len(data) // TRACE_DTYPE.itemsize) * TRACE_DTYPE.itemsize, b'\0')
+    return np.array([(TRACE_COND_DEF, len(data), cond_id, 0)], dtype=TRACE_DTYPE).tobytes() + padded
+
+
+def records(*edges):
+    return np.array(list(edges), dtype=TRACE_DTYPE).tobytes()
+
+
+def sample_trace():
+    """Same path as the text trace below, the conditions are defined before their first use"""
+    return (cond_def(0, 'Br_true_icmp_i32') + records((1, 2, 0, 1)) +
+            cond_def(1, 'Switch_i8_4') + records((2, 5, 1, 2), (1, 3, 0, 3), (2, 5, 1, 4)))
+
+
+def test_binary_trace_matches_text_trace():
+    text = b'\n'.join([b'[*] (Br_true_icmp_i32): 1,2', b'[*] (Switch_i8_4): 2,5', b'[*] (Br_true_icmp_i32): 1,3',
+                       b'[*] (Switch_i8_4): 2,5'])
+    shard, partial = dump_binary_trace(io.BytesIO(sample_trace()))
+    assert not partial
+    assert shard == dump_trace(text)
+
+
+def test_binary_trace_small_chunks():
+    """Records and condition strings split across the reads"""
+    expected, _ = dump_binary_trace(io.BytesIO(sample_trace()))
+    shard, partial = dump_binary_trace(io.BytesIO(sample_trace()), chunk_records=1)
+    assert not partial
+    assert shard == expected
+
+
+def test_truncated_record_is_partial():
+    data = sample_trace()
+    shard, partial = dump_binary_trace(io.BytesIO(data[:-TRACE_DTYPE.itemsize // 2]))
+    assert partial
+    # the complete records are kept
+    assert shard[1][1] == {2, 3}
+    assert shard[2][1] == {5}
+
+
+def test_truncated_condition_is_partial():
+    data = cond_def(0, 'Br_false_icmp_i64') + records((7, 8, 0, 1)) + cond_def(1, 'Br_true_memcmp')
+    shard, partial = dump_binary_trace(io.BytesIO(data[:-4]))
+    assert partial
+    assert shard == {7: ['Br_false_icmp_i64', {8}, 1]}
+
+
+def test_tracer_keeps_its_pool(tmp_path):
+    trace_bin = tmp_path.joinpath('trace')
+    trace_bin.write_text('#!/bin/sh\necho "[*] (Br_true_icmp_i32): 1,2" >&2\n')
+    trace_bin.chmod(0o755)
+    seeds = [tmp_path.joinpath(f'id:{idx:06d}') for idx in range(4)]
+    depot = StateDepot()
+    tracer = CorpusTracer(depot, trace_bin, '@@', jobs=2)
+    tracer.trace_corpus(seeds[:2])
+    pool = tracer.pool
+    tracer.trace_corpus(seeds[2:])
+    assert tracer.pool is pool
+    assert depot.cov_state[1].children == {2}
+    assert len(depot.cov_state[1].belongs) == 4
+    tracer.close()
+    assert tracer.pool is None
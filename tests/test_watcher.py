@@ -0,0 +1,75 @@
+import time
+
+from fuzz.watcher import CorpusIndex
+
+
+def make_fuzzer(sync_dir, name, stats=True):
+    fuzzer_dir = sync_dir.joinpath(name)
+    fuzzer_dir.joinpath('queue').mkdir(parents=True)
+    if stats:
+        fuzzer_dir.joinpath('fuzzer_stats').write_text('')
+    return fuzzer_dir
+
+
+def add_seed(fuzzer_dir, name, data=b'seed'):
+    fuzzer_dir.joinpath('queue', name).write_bytes(data)
+
+
+def test_discover_initial_instances(tmp_path):
+    make_fuzzer(tmp_path, 'afl')
+    make_fuzzer(tmp_path, 'cofuzz', stats=False)
+    tmp_path.joinpath('.cofuzz_shared').mkdir()
+    index = CorpusIndex(tmp_path)
+    assert [path.name for path in index.fuzzer_dirs()] == ['afl']
+    index.close()
+
+
+def test_discover_instance_started_later(tmp_path):
+    make_fuzzer(tmp_path, 'afl')
+    index = CorpusIndex(tmp_path)
+    make_fuzzer(tmp_path, 'afl2')
+    index.refresh()
+    assert sorted(path.name for path in index.fuzzer_dirs()) == ['afl', 'afl2']
+    index.close()
+
+
+def test_discover_stats_written_after_dir(tmp_path):
+    make_fuzzer(tmp_path, 'afl')
+    late = make_fuzzer(tmp_path, 'afl2', stats=False)
+    index = CorpusIndex(tmp_path)
+    index.refresh()
+    assert [path.name for path in index.fuzzer_dirs()] == ['afl']
+    # writing inside the instance dir leaves the mtime of the sync dir unchanged
+    late.joinpath('fuzzer_stats').write_text('')
+    index.refresh()
+    assert sorted(path.name for path in index.fuzzer_dirs()) == ['afl', 'afl2']
+    index.close()
+
+
+def test_untraced_and_solved_seeds(tmp_path):
+    fuzzer_dir = make_fuzzer(tmp_path, 'afl')
+    add_seed(fuzzer_dir, 'id:000000,orig:a')
+    add_seed(fuzzer_dir, 'id:000001,src:000000,op:havoc,+cov', b'longer seed')
+    index = CorpusIndex(tmp_path)
+    assert [seed.path.name for seed in index.untraced()] == ['id:000000,orig:a', 'id:000001,src:000000,op:havoc,+cov']
+    assert index.untraced() == []
+    add_seed(fuzzer_dir, 'id:000002,src:000001,op:flip1')
+    index.refresh(0.1)
+    assert [seed.path.name for seed in index.untraced()] == ['id:000002,src:000001,op:flip1']
+    # new coverage ranks first
+    assert index.unsolved(1)[0].path.name == 'id:000001,src:000000,op:havoc,+cov'
+    index.mark_solved('afl/id:000001,src:000000,op:havoc,+cov')
+    assert 'id:000001,src:000000,op:havoc,+cov' not in [seed.path.name for seed in index.unsolved(3)]
+    index.close()
+
+
+def test_wait_wakes_on_new_seed(tmp_path):
+    fuzzer_dir = make_fuzzer(tmp_path, 'afl')
+    index = CorpusIndex(tmp_path)
+    add_seed(fuzzer_dir, 'id:000000,orig:a')
+    start = time.time()
+    index.wait(5)
+    assert time.time() - start < 1
+    # waiting leaves the seed to refresh
+    assert [seed.path.name for seed in index.refresh()] == ['id:000000,orig:a']
+    index.close()
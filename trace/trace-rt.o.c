@@ -1,11 +1,220 @@
+#include <signal.h>
 #include <stdio.h>
+#include <stdlib.h>
+#include <unistd.h>
 
 #include "include/types.h"
 
+/* Binary trace mode: fixed-width records written to the fd named by
+   COFUZZ_TRACE_FD. Condition strings are interned, each distinct string is
+   defined once in the stream by a record with src == TRACE_COND_DEF,
+   followed by the string padded to the record size. The buffer is small and
+   also flushed on the fatal signals, so a crashing or killed target keeps the
+   tail of its trace; the reader treats a truncated last record as partial. */
+
+#define TRACE_FD_ENV "COFUZZ_TRACE_FD"
+#define TRACE_DEDUP_ENV "COFUZZ_TRACE_DEDUP"
+
+#define TRACE_COND_DEF 0xFFFFFFFF
+#define TRACE_BUF_RECS (1 << 8)
+#define COND_TABLE_SIZE (1 << 16)
+#define EDGE_TABLE_SIZE (1 << 18)
+#define COND_STR_MAX 4096
+
+struct trace_rec {
+  u32 src;
+  u32 dest;
+  u32 cond;
+  u32 depth;
+};
+
+struct cond_entry {
+  u64 key;
+  u32 id;
+};
+
+static s32 trace_fd = -2; /* -2: not initialized, -1: text mode */
+static u32 trace_depth;
+static u32 trace_buf_len;
+static volatile sig_atomic_t trace_flushing;
+static struct trace_rec trace_buf[TRACE_BUF_RECS];
+
+static u32 cond_cnt;
+static struct cond_entry cond_table[COND_TABLE_SIZE];
+
+static struct trace_rec* edge_table;
+static u32 edge_cnt;
+
+static void __trace_write(const void* data, u32 len) {
+  /* Write the whole chunk to the trace fd */
+
+  const u8* ptr = data;
+
+  while (len) {
+    ssize_t res = write(trace_fd, ptr, len);
+    if (res <= 0) {
+      trace_fd = -1;
+      return;
+    }
+    ptr += res;
+    len -= res;
+  }
+}
+
+static void __trace_flush(void) {
+  if (trace_fd < 0 || !trace_buf_len) return;
+
+  trace_flushing = 1;
+  __trace_write(trace_buf, trace_buf_len * sizeof(struct trace_rec));
+  trace_buf_len = 0;
+  trace_flushing = 0;
+}
+
+static const int trace_signals[] = {SIGSEGV, SIGBUS, SIGFPE, SIGILL, SIGABRT,
+                                    SIGTERM};
+static struct sigaction trace_old_act[sizeof(trace_signals) /
+                                      sizeof(trace_signals[0])];
+
+static void __trace_signal(int sig) {
+  /* Flush the buffer, then let the previous handler deal with the signal */
+
+  u32 idx;
+
+  /* an interrupted flush leaves a truncated record, do not write after it */
+  if (!trace_flushing) __trace_flush();
+
+  for (idx = 0; idx < sizeof(trace_signals) / sizeof(trace_signals[0]); idx++)
+    if (trace_signals[idx] == sig) sigaction(sig, &trace_old_act[idx], NULL);
+
+  /* delivered once the handler returns, as the signal is blocked until then */
+  raise(sig);
+}
+
+static void __trace_init(void) {
+  char*            fd_str = getenv(TRACE_FD_ENV);
+  struct sigaction act = {0};
+  u32              idx;
+
+  trace_fd = fd_str ? atoi(fd_str) : -1;
+  if (trace_fd < 0) return;
+
+  if (getenv(TRACE_DEDUP_ENV))
+    edge_table = calloc(EDGE_TABLE_SIZE, sizeof(struct trace_rec));
+
+  atexit(__trace_flush);
+
+  act.sa_handler = __trace_signal;
+  sigemptyset(&act.sa_mask);
+  for (idx = 0; idx < sizeof(trace_signals) / sizeof(trace_signals[0]); idx++) {
+    sigaction(trace_signals[idx], &act, &trace_old_act[idx]);
+    /* keep the signals the target ignores ignored */
+    if (trace_old_act[idx].sa_handler == SIG_IGN)
+      sigaction(trace_signals[idx], &trace_old_act[idx], NULL);
+  }
+}
+
+static void __trace_push(u32 src, u32 dest, u32 cond, u32 depth) {
+  struct trace_rec* rec = &trace_buf[trace_buf_len++];
+
+  rec->src = src;
+  rec->dest = dest;
+  rec->cond = cond;
+  rec->depth = depth;
+
+  if (trace_buf_len == TRACE_BUF_RECS) __trace_flush();
+}
+
+static void __trace_define(u32 id, u8* cond_str, u32 len) {
+  /* Emit the definition record followed by the padded string */
+
+  u8 pad[sizeof(struct trace_rec)] = {0};
+  u32 pad_len = (sizeof(struct trace_rec) - len % sizeof(struct trace_rec)) %
+                sizeof(struct trace_rec);
+
+  __trace_push(TRACE_COND_DEF, len, id, 0);
+  __trace_flush();
+  __trace_write(cond_str, len);
+  if (pad_len) __trace_write(pad, pad_len);
+}
+
+static u32 __trace_cond_id(u64 key, const char* fmt, const char* cond_str,
+                           u32 arg0, u32 arg1) {
+  /* Intern the condition, define it on first use */
+
+  u8  buf[COND_STR_MAX];
+  u32 idx = (u32)((key * 0x9E3779B97F4A7C15ULL) >> 48) % COND_TABLE_SIZE;
+  u32 probe, len, id;
+
+  for (probe = 0; probe < COND_TABLE_SIZE; probe++) {
+    struct cond_entry* entry = &cond_table[(idx + probe) % COND_TABLE_SIZE];
+    if (entry->key == key) return entry->id;
+    if (!entry->key) break;
+  }
+
+  if (cond_str)
+    len = snprintf((char*)buf, COND_STR_MAX, fmt, cond_str);
+  else
+    len = snprintf((char*)buf, COND_STR_MAX, fmt, arg0, arg1);
+  if (len >= COND_STR_MAX) len = COND_STR_MAX - 1;
+
+  id = cond_cnt++;
+  __trace_define(id, buf, len);
+
+  /* keep redefining once the table is full */
+  if (probe < COND_TABLE_SIZE && cond_cnt < COND_TABLE_SIZE * 3 / 4) {
+    cond_table[(idx + probe) % COND_TABLE_SIZE].key = key;
+    cond_table[(idx + probe) % COND_TABLE_SIZE].id = id;
+  }
+
+  return id;
+}
+
+static u8 __trace_seen(u32 src, u32 dest, u32 cond) {
+  /* Check and record the edge for in-process dedup */
+
+  u64 hash = ((u64)src << 32 | dest) ^ ((u64)cond * 0x9E3779B97F4A7C15ULL);
+  u32 idx = (u32)((hash * 0xFF51AFD7ED558CCDULL) >> 40) % EDGE_TABLE_SIZE;
+  u32 probe;
+
+  if (!edge_table || edge_cnt >= EDGE_TABLE_SIZE * 3 / 4) return 0;
+
+  for (probe = 0; probe < EDGE_TABLE_SIZE; probe++) {
+    struct trace_rec* entry = &edge_table[(idx + probe) % EDGE_TABLE_SIZE];
+    if (!entry->depth) {
+      entry->src = src;
+      entry->dest = dest;
+      entry->cond = cond;
+      entry->depth = 1;
+      edge_cnt++;
+      return 0;
+    }
+    if (entry->src == src && entry->dest == dest && entry->cond == cond)
+      return 1;
+  }
+
+  return 0;
+}
+
+static void __trace_record(u32 src, u32 dest, u32 cond) {
+  trace_depth++;
+  if (__trace_seen(src, dest, cond)) return;
+  __trace_push(src, dest, cond, trace_depth);
+}
+
 void __log_branch(u32 prev_loc, u32 succ_true, u32 succ_false, u8* condition,
                   u32 taken) {
   /* Log the branch condition */
 
+  if (trace_fd == -2) __trace_init();
+
+  if (trace_fd >= 0) {
+    u64 key = ((u64)(uintptr_t)condition << 1) | !!taken;
+    u32 cond = __trace_cond_id(key, taken ? "Br_true_%s" : "Br_false_%s",
+                               (char*)condition, 0, 0);
+    __trace_record(prev_loc, taken ? succ_true : succ_false, cond);
+    return;
+  }
+
   if (taken)
     fprintf(stderr, "[*] (Br_true_%s): %d,%d\n", condition, prev_loc,
             succ_true);
@@ -28,6 +237,15 @@ void __log_switch(u32 case_num, u32 bit_width, u32 prev_loc, u32 default_loc,
 
   if (!dest_loc) dest_loc = default_loc;
 
+  if (trace_fd == -2) __trace_init();
+
+  if (trace_fd >= 0) {
+    u64 key = (1ULL << 63) | ((u64)bit_width << 32) | case_num;
+    u32 cond = __trace_cond_id(key, "Switch_i%u_%u", NULL, bit_width, case_num);
+    __trace_record(prev_loc, dest_loc, cond);
+    return;
+  }
+
   fprintf(stderr, "[*] (Switch_i%d_%d): %d,%d\n", bit_width, case_num, prev_loc,
           dest_loc);
-}
\ No newline at end of file
+}